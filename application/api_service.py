@@ -0,0 +1,100 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+import httplib2
+from googleapiclient.discovery import build_from_document, DISCOVERY_URI
+from googleapiclient.errors import HttpError
+
+from application.message_logger import MessageLogger
+from application.response_cache import get_response_cache
+
+YOUTUBE_API_SERVICE_NAME = 'youtube'
+YOUTUBE_API_VERSION = 'v3'
+
+POOL_SIZE = 16                      # maximum number of idle clients kept with their open connections
+HTTP_TIMEOUT = 30                   # seconds a socket waits for the api before the request fails and is retried
+
+
+class ServiceFactory:
+    """
+    Process wide factory for YouTube api clients. The discovery document is downloaded and parsed once and the
+    clients are kept in a pool together with their keep-alive connections
+    """
+
+    def __init__(self, developer_key, pool_size=POOL_SIZE, http_cache=None, timeout=HTTP_TIMEOUT):
+        """
+        Class constructor
+        :param developer_key: the api key used by the clients
+        :param pool_size: the maximum number of idle clients kept in the pool
+        :param http_cache: the cache used by the http clients, the response cache of the process if it is not set
+        :param timeout: the socket timeout of the http clients in seconds
+        """
+        ml = MessageLogger('api_service')
+        self.__logger = ml.get_logger()
+
+        self.__developer_key = developer_key
+        self.__http_cache = http_cache if http_cache is not None else get_response_cache()
+        self.__timeout = timeout
+        self.__document = None
+        self.__document_lock = threading.Lock()
+        self.__pool = queue.LifoQueue(maxsize=pool_size)
+
+    @contextmanager
+    def client(self):
+        """
+        Checks out a client from the pool. A client is used by a single thread at a time, the http client is
+        not thread safe
+        :return: context manager with the api service
+        """
+        try:
+            service = self.__pool.get_nowait()
+        except queue.Empty:
+            service = self.__create_service()
+
+        try:
+            yield service
+        finally:
+            try:
+                self.__pool.put_nowait(service)
+            except queue.Full:
+                pass
+
+    def __create_service(self):
+        """
+        Creates a new api client from the cached discovery document
+        :return: the api service
+        """
+        http = httplib2.Http(cache=self.__http_cache, timeout=self.__timeout)
+        return build_from_document(self.__get_document(), http=http, developerKey=self.__developer_key)
+
+    def __get_document(self):
+        """
+        Downloads the discovery document of the api the first time it is needed
+        :return: the discovery document
+        """
+        with self.__document_lock:
+            if self.__document is None:
+                uri = DISCOVERY_URI.format(api=YOUTUBE_API_SERVICE_NAME, apiVersion=YOUTUBE_API_VERSION)
+                self.__logger.info("Downloading discovery document: " + uri)
+                response, content = httplib2.Http(timeout=self.__timeout).request(uri)
+                if response.status >= 400:
+                    raise HttpError(response, content, uri=uri)
+                self.__document = content
+            return self.__document
+
+
+__factories = {}
+__factories_lock = threading.Lock()
+
+
+def get_service_factory(developer_key):
+    """
+    Returns the factory of the process for an api key
+    :param developer_key: the api key
+    :return: the service factory
+    """
+    with __factories_lock:
+        if developer_key not in __factories:
+            __factories[developer_key] = ServiceFactory(developer_key)
+        return __factories[developer_key]
@@ -0,0 +1,51 @@
+import math
+
+COMMENTS_PER_PAGE = 100             # maximum number of comment threads in a commentThreads page
+
+
+def allocate_comment_pages(comment_counts, budget, comments_per_page=COMMENTS_PER_PAGE):
+    """
+    Splits a global budget of comment pages across videos proportionally to their number of comments. A video
+    never gets more pages than it needs to be crawled completely and every video with comments gets at least one
+    page while the budget allows it. The pages left by the small videos go to the big ones
+    :param comment_counts: dictionary with the comment count of every video, None if the count is unknown
+    :param budget: the total number of comment pages
+    :param comments_per_page: the number of comments in a page
+    :return: dictionary with the number of pages of every video
+    """
+
+    pages = {video_id: 0 for video_id in comment_counts}
+    needed = {}
+    for video_id, count in comment_counts.items():
+        if count is None:
+            needed[video_id] = 1                    # unknown count, the first page shows how many there are
+        else:
+            needed[video_id] = math.ceil(int(count) / comments_per_page)
+
+    # one page for every video with comments, the most commented first
+    for video_id in sorted(needed, key=lambda v: needed[v], reverse=True):
+        if budget <= 0:
+            return pages
+        if needed[video_id] > 0:
+            pages[video_id] = 1
+            budget -= 1
+
+    # proportional shares of the remaining budget, repeated while some videos are saturated
+    while budget > 0:
+        open_videos = {v: needed[v] - pages[v] for v in needed if needed[v] > pages[v]}
+        if not open_videos:
+            break
+        total = sum(open_videos.values())
+        shares = {v: min(open_videos[v], budget * open_videos[v] / total) for v in open_videos}
+        allocated = 0
+        for video_id, share in shares.items():
+            pages[video_id] += int(share)
+            allocated += int(share)
+        if allocated == 0:
+            # less pages than videos, the largest fractional shares get the last pages
+            for video_id in sorted(shares, key=lambda v: shares[v] - int(shares[v]), reverse=True)[:budget]:
+                pages[video_id] += 1
+                allocated += 1
+        budget -= allocated
+
+    return pages
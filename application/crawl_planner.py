@@ -0,0 +1,119 @@
+import math
+from collections import Counter
+
+from application.comment_budget import allocate_comment_pages, COMMENTS_PER_PAGE
+from application.quota_scheduler import ENDPOINT_COSTS
+
+SEARCH_PAGE_SIZE = 50               # results in a search page
+LIST_CHUNK_SIZE = 50                # ids in a statistics or channels request
+REQUEST_SECONDS = 0.4               # mean duration of an api round trip
+
+
+def estimate_crawl(nr_results, search_cached, videos, channels, playlists, comment_pages_limit, adaptive_comments=False,
+                   channel_expansion='playlists', channel_videos_limit=None, batch_size=0, concurrency=1,
+                   costs=None):
+    """
+    Estimates the api requests, quota units, edges and time of a crawl without sending any request. The known
+    comment counts and channel sizes come from the stored statistics, the unknown ones are taken at their limits,
+    so the estimate is an upper bound for them
+    :param nr_results: the number of search results
+    :param search_cached: True if the search results are served from the search cache
+    :param videos: dictionary with the comment count of every video, None if the count is unknown
+    :param channels: dictionary with the video count of every channel, None if the count is unknown
+    :param playlists: the number of playlists in the search results
+    :param comment_pages_limit: the number of comment pages per video
+    :param adaptive_comments: the comment pages are split across the videos by their comment count
+    :param channel_expansion: 'playlists' or 'uploads'
+    :param channel_videos_limit: the maximum number of videos of a channel crawled in 'uploads' mode
+    :param batch_size: the number of first page requests in an http batch, 0 if batching is disabled
+    :param concurrency: the number of requests running at the same time
+    :param costs: dictionary with the quota cost of every endpoint
+    :return: dictionary with the estimate
+    """
+
+    costs = costs if costs is not None else ENDPOINT_COSTS
+    requests = Counter()
+    first_pages = 0                 # requests that can be sent in http batches
+
+    # the crawler requests one more search page to store the token of the next results
+    if not search_cached and nr_results > 0:
+        requests['search'] = math.ceil(nr_results / SEARCH_PAGE_SIZE) + 1
+
+    # comment pages, one edge for every comment, the videos without statistics are counted at the page limit
+    comment_counts = {
+        video_id: comment_pages_limit * COMMENTS_PER_PAGE if count is None else int(count)
+        for video_id, count in videos.items()
+    }
+    if adaptive_comments:
+        comment_pages = allocate_comment_pages(comment_counts, comment_pages_limit * len(comment_counts))
+    else:
+        comment_pages = {
+            video_id: max(1, min(comment_pages_limit, math.ceil(count / COMMENTS_PER_PAGE)))
+            for video_id, count in comment_counts.items()
+        }
+    requests['commentThreads'] = sum(comment_pages.values())
+    first_pages += sum(1 for pages in comment_pages.values() if pages > 0)
+    edges = sum(min(comment_counts[video_id], pages * COMMENTS_PER_PAGE) for video_id, pages in comment_pages.items())
+    requests['videos'] = math.ceil(len(videos) / LIST_CHUNK_SIZE)
+    if playlists:
+        requests['playlistItems'] = playlists
+
+    # channel expansion, the unknown channels are counted with one page of videos
+    if channels:
+        requests['channels'] = math.ceil(len(channels) / LIST_CHUNK_SIZE)
+        if channel_expansion == 'uploads':
+            requests['channels'] += math.ceil(len(channels) / LIST_CHUNK_SIZE)
+            nr_uploads = 0
+            for video_count in channels.values():
+                uploads = SEARCH_PAGE_SIZE if video_count is None else int(video_count)
+                if channel_videos_limit is not None:
+                    uploads = min(uploads, channel_videos_limit)
+                nr_uploads += uploads
+                requests['playlistItems'] += max(1, math.ceil(uploads / SEARCH_PAGE_SIZE))
+            first_pages += len(channels)
+            requests['videos'] += math.ceil(nr_uploads / LIST_CHUNK_SIZE)
+        else:
+            requests['playlists'] = len(channels)
+            requests['playlistItems'] += sum(
+                1 if video_count is None else max(1, math.ceil(int(video_count) / SEARCH_PAGE_SIZE))
+                for video_count in channels.values()
+            )
+
+    nr_requests = sum(requests.values())
+    round_trips = nr_requests
+    if batch_size:
+        round_trips = nr_requests - first_pages + math.ceil(first_pages / batch_size)
+
+    # the search pages are requested one after the other, the rest in parallel
+    seconds = (requests['search'] + (round_trips - requests['search']) / max(1, concurrency)) * REQUEST_SECONDS
+
+    return {
+        'requests': nr_requests,
+        'endpoints': {endpoint: count for endpoint, count in requests.items() if count},
+        'quota': sum(costs.get(endpoint, 1) * count for endpoint, count in requests.items()),
+        'round trips': round_trips,
+        'edges': edges,
+        'seconds': seconds,
+        'search cached': search_cached
+    }
+
+
+def downscale_search(plan, nr_results, max_quota):
+    """
+    Finds the largest number of search results whose crawl fits in a quota budget
+    :param plan: function that returns the estimate for a number of results
+    :param nr_results: the requested number of results
+    :param max_quota: the quota units that the crawl can spend
+    :return: the number of results, 0 if not even one result fits
+    """
+    if plan(nr_results)['quota'] <= max_quota:
+        return nr_results
+
+    low, high = 0, nr_results
+    while low < high:
+        middle = (low + high + 1) // 2
+        if plan(middle)['quota'] <= max_quota:
+            low = middle
+        else:
+            high = middle - 1
+    return low
@@ -0,0 +1,227 @@
+import argparse
+import os
+import socket
+import threading
+import time
+import uuid
+
+from pymongo import errors
+
+from application.database import MongoDB
+from application.message_logger import MessageLogger
+from application.network_analysis import NetworkAnalysis
+from application.web_crawler import YoutubeAPI, CrawlStoppedError
+from utilities.auth import update_search_status, send_finished_process_confirmation, delete_user_network
+from utilities.config import engine
+from utilities.utils import NETWORKS_FOLDER, COMMENT_PAGES_LIMIT, CRAWLER_CONCURRENCY, INCREMENTAL_COMMENTS, \
+    INCLUDE_TEXT, ADAPTIVE_COMMENT_PAGES, CHANNEL_EXPANSION, CHANNEL_VIDEOS_LIMIT, REQUEST_BATCH_SIZE, \
+    WRITE_BATCH_SIZE, SKIP_UNCHANGED_WRITES
+
+# runs the crawl jobs queued by the web application, start one or more workers on every crawl machine
+#   python -m application.crawl_worker
+#   python -m application.crawl_worker --jobs 1
+# the workers must share the networks folder with the web application, and the SQL database of the [database]
+# section of config.txt where the search status is written
+
+JOB_LEASE_SECONDS = 5 * 60          # time a claimed job is reserved for a worker without a heartbeat
+HEARTBEAT_SECONDS = 60              # time between two renewals of the lease
+POLL_SECONDS = 5                    # time between two checks of an empty queue
+MAX_JOB_ATTEMPTS = 3                # a job is claimed at most this many times
+HEARTBEAT_FAILURES = 3              # failed renewals after which the lease is lost, before it can expire
+
+
+def enqueue_crawl_job(file_name, keyword, nr_videos, algorithm, user_id, email, first_name):
+    """
+    Adds a search to the crawl queue, the network is created by the first free worker
+    :param file_name: the name of the network files, also the id of the job
+    :param keyword: the search keyword
+    :param nr_videos: the number of searched videos
+    :param algorithm: the ranking algorithm
+    :param user_id: the id of the user that started the search
+    :param email: the email of the user, the confirmation is sent to it
+    :param first_name: the first name of the user
+    :return: True if the job was added, False otherwise
+    """
+    try:
+        db = MongoDB()
+    except errors.ConnectionFailure:
+        return False
+
+    return db.insert_crawl_job({
+        '_id': file_name,
+        'keyword': keyword,
+        'nr_videos': int(nr_videos),
+        'algorithm': algorithm,
+        'user_id': user_id,
+        'email': email,
+        'first_name': first_name
+    })
+
+
+class CrawlWorker:
+    """
+    Takes crawl jobs from the queue in MongoDB and creates their networks. A worker holds a lease on its job and
+    renews it with heartbeats, the job of a worker that stopped goes back to the queue when its lease expires.
+    The crawled data is written by id, so crawling a job again does not duplicate it
+    """
+
+    def __init__(self, worker_id=None, lease_seconds=JOB_LEASE_SECONDS, heartbeat_seconds=HEARTBEAT_SECONDS,
+                 poll_seconds=POLL_SECONDS, max_attempts=MAX_JOB_ATTEMPTS):
+        """
+        Class constructor
+        :param worker_id: the id of the worker, it is created from the host and the process if it is not set
+        :param lease_seconds: the number of seconds a claimed job is reserved for the worker
+        :param heartbeat_seconds: the number of seconds between two renewals of the lease
+        :param poll_seconds: the number of seconds between two checks of an empty queue
+        :param max_attempts: the maximum number of times a job is claimed
+        """
+        ml = MessageLogger('crawl_worker')
+        self.__logger = ml.get_logger()
+
+        self.__db = MongoDB()
+        if worker_id is None:
+            worker_id = socket.gethostname() + "-" + str(os.getpid()) + "-" + uuid.uuid4().hex[:8]
+        self.__worker_id = worker_id
+        self.__lease_seconds = lease_seconds
+        self.__heartbeat_seconds = heartbeat_seconds
+        self.__poll_seconds = poll_seconds
+        self.__max_attempts = max_attempts
+
+    def run(self, max_jobs=None):
+        """
+        Processes jobs until max_jobs are done, waiting for new jobs while the queue is empty
+        :param max_jobs: the number of jobs to process, unlimited if it is not set
+        :return: the number of processed jobs
+        """
+        self.__logger.info("Worker " + self.__worker_id + " started")
+        if engine.url.get_backend_name() == 'sqlite':
+            self.__logger.warning("The search status is written to the SQLite database " + str(engine.url) +
+                                  ", the web application only sees it if it runs on the same machine")
+        self.__db.ensure_indexes()
+        nr_jobs = 0
+
+        while max_jobs is None or nr_jobs < max_jobs:
+            for abandoned in self.__db.fail_abandoned_crawl_jobs(self.__max_attempts):
+                self.__logger.warning("Job [" + abandoned['_id'] + "] failed after " + str(abandoned['attempts']) +
+                                      " attempts")
+                update_search_status(abandoned['user_id'], abandoned['_id'], "Failed", engine)
+
+            job = self.__db.claim_crawl_job(self.__worker_id, self.__lease_seconds, self.__max_attempts)
+            if job is None:
+                time.sleep(self.__poll_seconds)
+                continue
+
+            self.__process_job(job)
+            nr_jobs += 1
+
+        return nr_jobs
+
+    def __process_job(self, job):
+        """
+        Crawls a job while a heartbeat thread renews its lease. When the lease is lost the crawl is stopped and
+        the job is left to the worker that claims it next
+        :param job: the job document
+        """
+        job_id = job['_id']
+        self.__logger.info("Worker " + self.__worker_id + " processing job [" + job_id + "] attempt " +
+                           str(job['attempts']))
+
+        crawler = YoutubeAPI(job_id, NETWORKS_FOLDER, COMMENT_PAGES_LIMIT, CRAWLER_CONCURRENCY,
+                             incremental_comments=INCREMENTAL_COMMENTS, include_text=INCLUDE_TEXT,
+                             adaptive_comments=ADAPTIVE_COMMENT_PAGES,
+                             channel_expansion=CHANNEL_EXPANSION, channel_videos_limit=CHANNEL_VIDEOS_LIMIT,
+                             batch_size=REQUEST_BATCH_SIZE, write_batch_size=WRITE_BATCH_SIZE,
+                             skip_unchanged=SKIP_UNCHANGED_WRITES)
+        stop = threading.Event()
+        lost = threading.Event()
+        heartbeat = threading.Thread(target=self.__heartbeat, args=(job_id, crawler, stop, lost), daemon=True)
+        heartbeat.start()
+        try:
+            error = self.__crawl(job, crawler, lost)
+        except CrawlStoppedError:
+            error = None
+        except Exception as e:
+            self.__logger.exception("Job [" + job_id + "] failed")
+            error = str(e)
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        if lost.is_set():
+            self.__logger.warning("Worker " + self.__worker_id + " stopped job [" + job_id + "]")
+            return
+
+        if error is not None:
+            update_search_status(job['user_id'], job_id, "Failed", engine)
+        self.__db.finish_crawl_job(job_id, self.__worker_id, 'done' if error is None else 'failed', error)
+
+    def __heartbeat(self, job_id, crawler, stop, lost):
+        """
+        Renews the lease of a job until the job is finished. The crawl is stopped when another worker holds the job
+        or when HEARTBEAT_FAILURES renewals in a row failed, because the lease may expire and the job be claimed again
+        :param job_id: the id of the job
+        :param crawler: the crawler of the job
+        :param stop: event that is set when the job is finished
+        :param lost: event that is set when the lease is lost
+        """
+        failures = 0
+        while not stop.wait(self.__heartbeat_seconds):
+            renewed = self.__db.renew_crawl_job(job_id, self.__worker_id, self.__lease_seconds)
+            failures = failures + 1 if renewed is None else 0
+            if renewed is False or failures >= HEARTBEAT_FAILURES:
+                self.__logger.warning("Worker " + self.__worker_id + " lost the lease of job [" + job_id + "]")
+                lost.set()
+                crawler.stop()
+                return
+
+    def __crawl(self, job, crawler, lost):
+        """
+        Retrieves the data of a search and creates its ranked network
+        :param job: the job document
+        :param crawler: the crawler of the job
+        :param lost: event that is set when the lease of the job is lost
+        :return: None if the network was created or the crawl was stopped, the error message otherwise
+        """
+        file_name = job['_id']
+        update_search_status(job['user_id'], file_name, "Retrieving Data", engine)
+
+        results = crawler.search(job['keyword'], job['nr_videos'])
+        if not results:
+            return "Search results cannot be obtained"
+
+        network = NetworkAnalysis(NETWORKS_FOLDER)
+        network.set_files(file_name, file_name)
+        network.start_network()
+        for source, target, source_name, target_name in crawler.stream_network(results):
+            network.add_edge(source, target, source_name, target_name)
+
+        # the network is stored by the worker that holds the lease
+        if lost.is_set():
+            return None
+
+        update_search_status(job['user_id'], file_name, "Processing Data", engine)
+        if not network.compute_ranking(job['algorithm']):
+            delete_user_network(file_name, engine)
+            return "Algorithm " + job['algorithm'] + " is not implemented"
+        network.store_network()
+
+        if send_finished_process_confirmation(job['email'], job['first_name'], job['keyword']):
+            self.__logger.info("Confirmation sent to " + str(job['email']) + " " + str(job['first_name']))
+        else:
+            self.__logger.warning("Confirmation NOT sent to " + str(job['email']) + " " + str(job['first_name']))
+
+        update_search_status(job['user_id'], file_name, "Finished", engine)
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl worker")
+    parser.add_argument('--jobs', type=int, help="number of jobs to process before exiting")
+    parser.add_argument('--poll', type=float, default=POLL_SECONDS, help="seconds between checks of an empty queue")
+    args = parser.parse_args()
+
+    CrawlWorker(poll_seconds=args.poll).run(args.jobs)
+
+
+if __name__ == '__main__':
+    main()
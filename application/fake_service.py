@@ -0,0 +1,462 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+ENDPOINTS = ['search', 'channels', 'playlists', 'playlistItems', 'videos', 'commentThreads']
+RECORDING_EXTENSION = '.json'
+PAGE_SIZE = 50                      # items in a page of the synthetic search, playlists and playlist items
+COMMENTS_PAGE_SIZE = 100            # comment threads in a page of the synthetic comments
+
+
+class FakeRequest:
+    """
+    Request object returned by the fake service, it mimics googleapiclient.http.HttpRequest
+    """
+
+    def __init__(self, service, endpoint, kwargs):
+        """
+        Class constructor
+        :param service: the fake service that created the request
+        :param endpoint: the name of the api resource
+        :param kwargs: the arguments of the list request
+        """
+        self.endpoint = endpoint
+        self.kwargs = kwargs
+        self.headers = {}
+        self.__service = service
+
+    def execute(self):
+        """
+        Returns the response of the request
+        :return: the response dictionary
+        """
+        return self.__service.respond(self)
+
+
+class FakeBatchRequest:
+    """
+    Batch object returned by the fake service, it mimics googleapiclient.http.BatchHttpRequest
+    """
+
+    def __init__(self, service, callback=None):
+        """
+        Class constructor
+        :param service: the fake service that created the batch
+        :param callback: the function called with (request_id, response, exception) for every request
+        """
+        self.__service = service
+        self.__callback = callback
+        self.__requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        """
+        Adds a request to the batch
+        :param request: the fake request
+        :param callback: the function called for this request instead of the batch callback
+        :param request_id: the id passed to the callback, the position in the batch if it is not set
+        """
+        if request_id is None:
+            request_id = str(len(self.__requests) + 1)
+        self.__requests.append((request_id, request, callback or self.__callback))
+
+    def execute(self):
+        """
+        Answers all the requests of the batch in one round trip and calls their callbacks
+        """
+        results = self.__service.respond_batch([request for _, request, _ in self.__requests])
+        for (request_id, _, callback), (response, exception) in zip(self.__requests, results):
+            if callback is not None:
+                callback(request_id, response, exception)
+
+
+class FakeResource:
+    """
+    Api resource of the fake service that creates list requests
+    """
+
+    def __init__(self, service, endpoint):
+        """
+        Class constructor
+        :param service: the fake service
+        :param endpoint: the name of the api resource
+        """
+        self.__service = service
+        self.__endpoint = endpoint
+
+    def list(self, **kwargs):
+        """
+        Creates a list request
+        :param kwargs: the arguments of the request
+        :return: the request object
+        """
+        return FakeRequest(self.__service, self.__endpoint, dict(kwargs))
+
+
+class FakeYoutubeService:
+    """
+    Local replacement for the YouTube Data API service that answers the requests without network access
+    """
+
+    def __init__(self, handlers=None, latency=0.0, error_rate=0.0, seed=None):
+        """
+        Class constructor
+        :param handlers: dictionary with a function for every endpoint that receives the request arguments and
+        returns the response dictionary or raises an HttpError
+        :param latency: the mean number of seconds added to every request, the delays are uniform in [0, 2*latency]
+        :param error_rate: the probability of answering a request with a 500 backendError
+        :param seed: the seed of the injected delays and errors
+        """
+        self.__handlers = handlers if handlers is not None else {}
+        self.__latency = latency
+        self.__error_rate = error_rate
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.calls = []                     # (endpoint, arguments) of every executed request
+        self.round_trips = 0                # number of http round trips, a batch is one round trip
+
+    def __getattr__(self, endpoint):
+        """
+        Returns the resource factory for an endpoint, like service.commentThreads()
+        :param endpoint: the name of the api resource
+        :return: function that creates the resource
+        """
+        if endpoint not in ENDPOINTS:
+            raise AttributeError(endpoint)
+        return lambda: FakeResource(self, endpoint)
+
+    def new_batch_http_request(self, callback=None):
+        """
+        Creates a batch of requests, like service.new_batch_http_request()
+        :param callback: the function called with (request_id, response, exception) for every request
+        :return: the batch object
+        """
+        return FakeBatchRequest(self, callback)
+
+    def respond(self, request):
+        """
+        Computes the response of a request with the handler of its endpoint
+        :param request: the fake request
+        :return: the response dictionary
+        """
+        self.__wait_round_trip()
+        return self.__answer(request)
+
+    def respond_batch(self, requests):
+        """
+        Computes the responses of the requests of a batch, the latency is added once for the whole batch
+        :param requests: the list of fake requests
+        :return: list with the (response, exception) of every request
+        """
+        self.__wait_round_trip()
+        results = []
+        for request in requests:
+            try:
+                results.append((self.__answer(request), None))
+            except HttpError as e:
+                results.append((None, e))
+        return results
+
+    def __wait_round_trip(self):
+        """
+        Counts a round trip and waits for its injected latency
+        """
+        with self.__lock:
+            self.round_trips += 1
+            delay = self.__random.uniform(0, 2 * self.__latency) if self.__latency else 0
+        if delay:
+            time.sleep(delay)
+
+    def __answer(self, request):
+        """
+        Answers one request or raises its injected error
+        :param request: the fake request
+        :return: the response dictionary
+        """
+        with self.__lock:
+            self.calls.append((request.endpoint, request.kwargs))
+            failed = self.__random.random() < self.__error_rate
+
+        if failed:
+            raise http_error(500, 'backendError')
+
+        handler = self.__handlers.get(request.endpoint)
+        if handler is None:
+            return {'etag': '', 'pageInfo': {'totalResults': 0}, 'items': []}
+        return handler(**request.kwargs)
+
+
+def request_key(endpoint, kwargs):
+    """
+    Creates the key of a recorded request from its endpoint and arguments
+    :param endpoint: the name of the api resource
+    :param kwargs: the arguments of the list request
+    :return: the key of the request
+    """
+    return hashlib.sha1(json.dumps([endpoint, kwargs], sort_keys=True, default=str).encode()).hexdigest()
+
+
+class RecordingService(FakeYoutubeService):
+    """
+    Service that sends the requests to the YouTube api and stores the responses, so they can be replayed later.
+    The conditional headers are not forwarded, so every recording holds a full page
+    """
+
+    def __init__(self, factory, directory):
+        """
+        Class constructor
+        :param factory: the service factory that provides the api clients
+        :param directory: the directory where the responses are written
+        """
+        super().__init__()
+        self.__factory = factory
+        self.__directory = directory
+
+    def respond(self, request):
+        """
+        Sends a request to the api and writes the response
+        :param request: the fake request
+        :return: the response dictionary
+        """
+        self.calls.append((request.endpoint, request.kwargs))
+        self.round_trips += 1
+        with self.__factory.client() as service:
+            api_request = getattr(service, request.endpoint)().list(**request.kwargs)
+            try:
+                response = api_request.execute()
+                recording = {'endpoint': request.endpoint, 'kwargs': request.kwargs, 'response': response}
+            except HttpError as e:
+                response = e
+                recording = {'endpoint': request.endpoint, 'kwargs': request.kwargs, 'status': e.resp.status,
+                             'content': e.content.decode(errors='replace')}
+
+        path = os.path.join(self.__directory, request.endpoint)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, request_key(request.endpoint, request.kwargs) + RECORDING_EXTENSION), 'w') as f:
+            json.dump(recording, f)
+
+        if isinstance(response, HttpError):
+            raise response
+        return response
+
+    def respond_batch(self, requests):
+        """
+        Sends the requests of a batch one by one, so every response is recorded by itself
+        :param requests: the list of fake requests
+        :return: list with the (response, exception) of every request
+        """
+        results = []
+        for request in requests:
+            try:
+                results.append((self.respond(request), None))
+            except HttpError as e:
+                results.append((None, e))
+        return results
+
+
+class ReplayService(FakeYoutubeService):
+    """
+    Service that answers the requests with the responses written by a RecordingService. A request that was not
+    recorded gets a 404 error
+    """
+
+    def __init__(self, directory, latency=0.0, error_rate=0.0, seed=None):
+        """
+        Class constructor
+        :param directory: the directory with the recorded responses
+        :param latency: the mean number of seconds added to every request
+        :param error_rate: the probability of answering a request with a 500 backendError
+        :param seed: the seed of the injected delays and errors
+        """
+        handlers = {endpoint: self.__replay_handler(directory, endpoint) for endpoint in ENDPOINTS}
+        super().__init__(handlers, latency, error_rate, seed)
+
+    @staticmethod
+    def __replay_handler(directory, endpoint):
+        """
+        Creates the handler that reads the recorded responses of an endpoint
+        :param directory: the directory with the recorded responses
+        :param endpoint: the name of the api resource
+        :return: the handler function
+        """
+
+        def handler(**kwargs):
+            path = os.path.join(directory, endpoint, request_key(endpoint, kwargs) + RECORDING_EXTENSION)
+            if not os.path.exists(path):
+                raise http_error(404, 'notRecorded')
+            with open(path) as f:
+                recording = json.load(f)
+            if 'status' in recording:
+                raise HttpError(httplib2.Response({'status': recording['status']}), recording['content'].encode())
+            return recording['response']
+
+        return handler
+
+
+class SyntheticYoutubeService(FakeYoutubeService):
+    """
+    Service that generates a deterministic comment graph of any size. The search returns nr_videos videos, each
+    with comments_per_video comment threads written by users drawn from a pool of nr_users with a skewed
+    distribution, like the few very active users of the real platform
+    """
+
+    def __init__(self, nr_videos=50, comments_per_video=500, replies_per_comment=2, nr_users=10000, nr_channels=20,
+                 latency=0.0, error_rate=0.0, seed=0):
+        """
+        Class constructor
+        :param nr_videos: the number of videos returned by a search
+        :param comments_per_video: the number of comment threads of every video
+        :param replies_per_comment: the number of replies of every comment thread, at most 5 like the api
+        :param nr_users: the number of users that write comments
+        :param nr_channels: the number of channels that upload the videos
+        :param latency: the mean number of seconds added to every request
+        :param error_rate: the probability of answering a request with a 500 backendError
+        :param seed: the seed of the generated graph and of the injected delays and errors
+        """
+        self.__nr_videos = nr_videos
+        self.__comments_per_video = comments_per_video
+        self.__replies_per_comment = min(replies_per_comment, 5)
+        self.__nr_users = nr_users
+        self.__nr_channels = nr_channels
+        self.__seed = seed
+        super().__init__({
+            'search': self.__search,
+            'channels': self.__channels,
+            'playlists': self.__playlists,
+            'playlistItems': self.__playlist_items,
+            'videos': self.__videos,
+            'commentThreads': self.__comment_threads,
+        }, latency, error_rate, seed)
+
+    def __user(self, video_index, comment_index, reply_index):
+        """
+        Draws the author of a comment, the same position always has the same author
+        :return: the user index
+        """
+        rnd = random.Random(hash((self.__seed, video_index, comment_index, reply_index)))
+        return min(int(rnd.paretovariate(1.2)) - 1, self.__nr_users - 1)
+
+    def __video_channel(self, video_index):
+        return 'UCsynthetic' + str(video_index % self.__nr_channels)
+
+    @staticmethod
+    def __page(items, page_size, page_token, list_id):
+        """
+        Selects the page of a list of items, the tokens hold the id of their list like the api ones, so a token
+        sent with another list is rejected instead of returning a page of the wrong list
+        :param items: the number of items in the list
+        :param page_size: the number of items in a page
+        :param page_token: the token of the page, the list id and the index of its first item
+        :param list_id: the id of the paged list
+        :return: the range of the page and the next page token
+        """
+        start = 0
+        if page_token:
+            token_list_id, _, index = page_token.rpartition(':')
+            if token_list_id != list_id or not index.isdigit():
+                raise http_error(400, 'invalidPageToken')
+            start = int(index)
+        end = min(start + page_size, items)
+        return range(start, end), list_id + ':' + str(end) if end < items else None
+
+    @staticmethod
+    def __response(etag, items, next_page_token, total_results=None):
+        response = {'etag': etag, 'items': items, 'pageInfo': {'totalResults': total_results or len(items)}}
+        if next_page_token:
+            response['nextPageToken'] = next_page_token
+        return response
+
+    @staticmethod
+    def __snippet(title, channel_id):
+        return {'title': title, 'description': title + ' description', 'publishedAt': '2020-01-01T00:00:00Z',
+                'channelId': channel_id}
+
+    def __search(self, maxResults=PAGE_SIZE, pageToken=None, **kwargs):
+        videos, next_page_token = self.__page(self.__nr_videos, maxResults, pageToken, 'search')
+        items = [{
+            'id': {'kind': 'youtube#video', 'videoId': 'synthetic' + str(i)},
+            'snippet': self.__snippet('Video ' + str(i), self.__video_channel(i))
+        } for i in videos]
+        return self.__response('"search-' + str(pageToken) + '"', items, next_page_token, self.__nr_videos)
+
+    def __channels(self, id='', **kwargs):
+        items = [{
+            'id': channel_id,
+            'snippet': self.__snippet('Channel ' + channel_id, channel_id),
+            'statistics': {'viewCount': '1000', 'subscriberCount': '100', 'videoCount': str(self.__nr_videos)},
+            'contentDetails': {'relatedPlaylists': {'uploads': 'UU' + channel_id}}
+        } for channel_id in id.split(',') if channel_id]
+        return self.__response('"channels-' + id + '"', items, None)
+
+    def __playlists(self, channelId='', **kwargs):
+        items = [{'id': 'PL' + channelId, 'snippet': self.__snippet('Uploads ' + channelId, channelId)}]
+        return self.__response('"playlists-' + channelId + '"', items, None)
+
+    def __playlist_items(self, playlistId='', maxResults=PAGE_SIZE, pageToken=None, **kwargs):
+        channel_id = playlistId[2:]
+        channel_videos = [i for i in range(self.__nr_videos) if self.__video_channel(i) == channel_id]
+        page, next_page_token = self.__page(len(channel_videos), maxResults, pageToken, playlistId)
+        items = [{
+            'snippet': dict(self.__snippet('Video ' + str(channel_videos[i]), channel_id),
+                            resourceId={'videoId': 'synthetic' + str(channel_videos[i])})
+        } for i in page]
+        return self.__response('"playlistItems-' + playlistId + str(pageToken) + '"', items, next_page_token)
+
+    def __videos(self, id='', **kwargs):
+        items = [{
+            'id': video_id,
+            'statistics': {
+                'viewCount': str(self.__comments_per_video * 100),
+                'likeCount': str(self.__comments_per_video * 10),
+                'commentCount': str(self.__comments_per_video * (1 + self.__replies_per_comment))
+            }
+        } for video_id in id.split(',') if video_id]
+        return self.__response('"videos-' + id + '"', items, None)
+
+    def __comment(self, video_id, video_index, comment_index, reply_index):
+        user = self.__user(video_index, comment_index, reply_index)
+        minute = self.__comments_per_video - comment_index
+        return {
+            'videoId': video_id,
+            'authorDisplayName': 'User ' + str(user),
+            'authorChannelId': {'value': 'UCuser' + str(user)},
+            'textDisplay': 'Comment ' + str(comment_index),
+            'likeCount': comment_index % 7,
+            'publishedAt': '2020-01-%02dT%02d:%02d:00Z' % (1 + minute // 1440, minute // 60 % 24, minute % 60)
+        }
+
+    def __comment_threads(self, videoId='', maxResults=COMMENTS_PAGE_SIZE, pageToken=None, **kwargs):
+        if not videoId.startswith('synthetic'):
+            raise http_error(404, 'videoNotFound')
+        video_index = int(videoId[len('synthetic'):])
+        page, next_page_token = self.__page(self.__comments_per_video, maxResults, pageToken, videoId)
+        items = []
+        for c in page:
+            thread_id = videoId + '.' + str(c)
+            item = {
+                'id': thread_id,
+                'snippet': {'topLevelComment': {'snippet': self.__comment(videoId, video_index, c, 0)}}
+            }
+            if self.__replies_per_comment:
+                item['replies'] = {'comments': [{
+                    'id': thread_id + '.' + str(r),
+                    'snippet': self.__comment(videoId, video_index, c, r)
+                } for r in range(1, self.__replies_per_comment + 1)]}
+            items.append(item)
+        return self.__response('"commentThreads-' + videoId + str(pageToken) + '"', items, next_page_token)
+
+
+def http_error(status, reason=''):
+    """
+    Creates an HttpError like the ones raised by the api client
+    :param status: the http status code
+    :param reason: the error reason from the api
+    :return: the error object
+    """
+    content = ('{"error": {"code": %d, "errors": [{"reason": "%s"}]}}' % (status, reason)).encode()
+    return HttpError(httplib2.Response({'status': status}), content)
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from application.message_logger import MessageLogger
+from application.quota_scheduler import QuotaScheduler, QuotaExceededError, DAILY_QUOTA
+
+KEY_CONCURRENCY = 8                 # maximum number of requests that use the same key at the same time
+KEY_COOLDOWN = 60 * 60              # seconds an exhausted key is skipped before it is tried again
+
+
+def load_keys():
+    """
+    Reads the api keys from the environment, GOOGLE_DEV_KEYS holds a comma separated list of keys and
+    GOOGLE_DEV_KEY a single key
+    :return: list with the api keys
+    """
+    load_dotenv()
+    keys = [key.strip() for key in os.getenv('GOOGLE_DEV_KEYS', "").split(',') if key.strip()]
+    single_key = os.getenv('GOOGLE_DEV_KEY')
+    if single_key and single_key not in keys:
+        keys.append(single_key)
+    return keys
+
+
+def mask_key(key):
+    """
+    Hides an api key for the logs and the counters
+    :param key: the api key
+    :return: the last characters of the key
+    """
+    return "..." + str(key)[-4:]
+
+
+class KeyPool:
+    """
+    Pool of api keys, every key belongs to a project with its own daily quota. The requests are spread over the
+    keys with the most remaining quota, a key is used by a limited number of requests at a time and a key that
+    exhausted its quota is skipped until the cooldown passes
+    """
+
+    def __init__(self, keys, capacity=DAILY_QUOTA, concurrency=KEY_CONCURRENCY, cooldown=KEY_COOLDOWN):
+        """
+        Class constructor
+        :param keys: list with the api keys
+        :param capacity: the daily quota units of every key
+        :param concurrency: the maximum number of requests that use a key at the same time
+        :param cooldown: the seconds an exhausted key is skipped
+        """
+        ml = MessageLogger('key_pool')
+        self.__logger = ml.get_logger()
+
+        self.__keys = list(keys)
+        self.__concurrency = max(1, concurrency)
+        self.__cooldown = cooldown
+        self.__schedulers = {key: QuotaScheduler(capacity=capacity) for key in self.__keys}
+        self.__in_use = {key: 0 for key in self.__keys}
+        self.__exhausted_until = {key: 0.0 for key in self.__keys}
+        self.__failovers = 0
+        self.__condition = threading.Condition()
+
+        if not self.__keys:
+            self.__logger.warning("No api keys are set")
+
+    def get_keys(self):
+        """
+        Returns the keys of the pool
+        :return: list with the api keys
+        """
+        return list(self.__keys)
+
+    @contextmanager
+    def lease(self, endpoint, nr_requests=1):
+        """
+        Reserves a key with enough quota for a request, it waits while all the available keys are busy
+        :param endpoint: the name of the api resource
+        :param nr_requests: the number of requests sent together, like the requests of an http batch
+        :return: context manager with the api key
+        """
+        key = self.__acquire(endpoint, nr_requests)
+        try:
+            yield key
+        finally:
+            with self.__condition:
+                self.__in_use[key] -= 1
+                self.__condition.notify()
+
+    def mark_exhausted(self, key):
+        """
+        Skips a key until the cooldown passes, called when the api answers with quotaExceeded
+        :param key: the api key
+        """
+        with self.__condition:
+            self.__exhausted_until[key] = time.monotonic() + self.__cooldown
+            self.__failovers += 1
+            self.__condition.notify_all()
+        self.__logger.warning("Quota exceeded for key " + mask_key(key) + ", switching to the next key")
+
+    def get_counters(self):
+        """
+        Returns the quota counters of the pool and of every key
+        :return: dictionary with the total spent and remaining quota units and the counters of every key
+        """
+        with self.__condition:
+            now = time.monotonic()
+            keys = {}
+            for key in self.__keys:
+                counters = self.__schedulers[key].get_counters()
+                counters['in use'] = self.__in_use[key]
+                counters['exhausted'] = self.__exhausted_until[key] > now
+                keys[mask_key(key)] = counters
+
+            return {
+                'capacity': sum(counters['capacity'] for counters in keys.values()),
+                'remaining': sum(counters['remaining'] for counters in keys.values() if not counters['exhausted']),
+                'spent': sum(counters['spent'] for counters in keys.values()),
+                'failovers': self.__failovers,
+                'keys': keys
+            }
+
+    def __acquire(self, endpoint, nr_requests):
+        """
+        Picks the available key with the most remaining quota that has a free request slot and takes the quota of
+        the requests from it
+        :param endpoint: the name of the api resource
+        :param nr_requests: the number of requests sent together
+        :return: the api key
+        """
+        with self.__condition:
+            while True:
+                now = time.monotonic()
+                available = [key for key in self.__keys if self.__exhausted_until[key] <= now]
+                if not available:
+                    raise QuotaExceededError("All the api keys exhausted their quota")
+
+                free = [key for key in available if self.__in_use[key] < self.__concurrency]
+                if not free:
+                    self.__condition.wait()
+                    continue
+
+                free.sort(key=lambda k: self.__schedulers[k].get_counters()['remaining'], reverse=True)
+                for key in free:
+                    if self.__schedulers[key].acquire(endpoint, nr_requests=nr_requests):
+                        self.__in_use[key] += 1
+                        return key
+                raise QuotaExceededError("Not enough quota for " + endpoint + " request")
+
+
+# keys shared by all the crawlers of the process
+key_pool = KeyPool(load_keys())
@@ -90,6 +90,25 @@ class NetworkAnalysis:
 
         self.__labels = pickle.load(open(self.__networks_folder + self.__data_file + OBJECT_EXTENSION, "rb"))
 
+    def start_network(self):
+        """
+        Creates an empty network that is built incrementally with add_edge
+        """
+        self.__graph = nx.DiGraph()
+        self.__labels = {}
+
+    def add_edge(self, source, target, source_name, target_name):
+        """
+        Adds an edge to the network while the data is still retrieved
+        :param source: the id of the source user
+        :param target: the id of the target user
+        :param source_name: the name of the source user
+        :param target_name: the name of the target user
+        """
+        self.__graph.add_edge(source, target)
+        self.__labels[source] = source_name
+        self.__labels[target] = target_name
+
     def store_network(self):
         self.logger.info("Stored network: " + self.__networks_folder + self.__data_file + NETWORK_OBJECT_EXTENSION)
         nx.write_gpickle(self.__graph, self.__networks_folder + self.__data_file + NETWORK_OBJECT_EXTENSION)
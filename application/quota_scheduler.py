@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import defaultdict
+
+from application.message_logger import MessageLogger
+
+DAILY_QUOTA = 10000                 # quota units available for a project in a day
+REFILL_PERIOD = 24 * 60 * 60        # seconds needed to refill the whole quota
+
+# priority classes - lower values are more important
+PRIORITY_HIGH = 0                   # requests that yield graph edges
+PRIORITY_NORMAL = 1                 # requests that discover new resources
+PRIORITY_LOW = 2                    # requests for metadata
+
+# quota units charged by the youtube data api for one list request
+ENDPOINT_COSTS = {
+    'search': 100,
+    'channels': 1,
+    'playlists': 1,
+    'playlistItems': 1,
+    'videos': 1,
+    'commentThreads': 1,
+}
+
+ENDPOINT_PRIORITIES = {
+    'commentThreads': PRIORITY_HIGH,
+    'search': PRIORITY_NORMAL,
+    'playlists': PRIORITY_NORMAL,
+    'playlistItems': PRIORITY_NORMAL,
+    'channels': PRIORITY_LOW,
+    'videos': PRIORITY_LOW,
+}
+
+# fraction of the quota that a priority class cannot spend, it is kept for the more important classes
+PRIORITY_RESERVES = {
+    PRIORITY_HIGH: 0.0,
+    PRIORITY_NORMAL: 0.1,
+    PRIORITY_LOW: 0.2,
+}
+
+
+class QuotaExceededError(Exception):
+    """
+    Raised when the scheduler does not have enough quota for a request
+    """
+
+
+class QuotaScheduler:
+    """
+    Token bucket scheduler that accounts the quota units spent on every YouTube Data API endpoint
+    """
+
+    def __init__(self, capacity=DAILY_QUOTA, refill_period=REFILL_PERIOD, costs=None, priorities=None,
+                 reserves=None):
+        """
+        Class constructor
+        :param capacity: the maximum number of quota units in the bucket
+        :param refill_period: the number of seconds in which an empty bucket is refilled
+        :param costs: dictionary with the cost of every endpoint
+        :param priorities: dictionary with the default priority class of every endpoint
+        :param reserves: dictionary with the reserved fraction of the capacity for every priority class
+        """
+        ml = MessageLogger('quota_scheduler')
+        self.__logger = ml.get_logger()
+
+        self.__capacity = capacity
+        self.__refill_rate = capacity / refill_period
+        self.__costs = costs if costs is not None else ENDPOINT_COSTS
+        self.__priorities = priorities if priorities is not None else ENDPOINT_PRIORITIES
+        self.__reserves = reserves if reserves is not None else PRIORITY_RESERVES
+
+        self.__tokens = capacity
+        self.__last_refill = time.monotonic()
+        self.__condition = threading.Condition()
+
+        self.__spent = defaultdict(int)         # quota units spent for every endpoint
+        self.__requests = defaultdict(int)      # number of requests for every endpoint
+        self.__denied = defaultdict(int)        # number of denied requests for every endpoint
+
+    def get_cost(self, endpoint):
+        """
+        Returns the quota cost of an endpoint
+        :param endpoint: the name of the api resource
+        :return: the number of quota units
+        """
+        return self.__costs.get(endpoint, 1)
+
+    def acquire(self, endpoint, priority=None, timeout=0, nr_requests=1):
+        """
+        Takes the quota for a request from the bucket
+        :param endpoint: the name of the api resource
+        :param priority: the priority class of the request, the endpoint default is used if it is not set
+        :param timeout: number of seconds to wait for the bucket to refill
+        :param nr_requests: the number of requests, the requests of an http batch are charged together
+        :return: True if the requests can be sent, False otherwise
+        """
+        cost = self.get_cost(endpoint) * nr_requests
+        if priority is None:
+            priority = self.__priorities.get(endpoint, PRIORITY_NORMAL)
+        reserve = self.__reserves.get(priority, 0.0) * self.__capacity
+        deadline = time.monotonic() + timeout
+
+        with self.__condition:
+            while True:
+                self.__refill()
+                if self.__tokens - cost >= reserve:
+                    self.__tokens -= cost
+                    self.__spent[endpoint] += cost
+                    self.__requests[endpoint] += nr_requests
+                    return True
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.__denied[endpoint] += 1
+                    self.__logger.warning("Quota denied for " + endpoint + " request with priority " + str(priority))
+                    return False
+                self.__condition.wait(min(remaining, (cost + reserve - self.__tokens) / self.__refill_rate))
+
+    def get_counters(self):
+        """
+        Returns the live quota counters
+        :return: dictionary with the spent and remaining quota and the per endpoint counters
+        """
+        with self.__condition:
+            self.__refill()
+            return {
+                'capacity': self.__capacity,
+                'remaining': int(self.__tokens),
+                'spent': sum(self.__spent.values()),
+                'endpoints': {
+                    endpoint: {
+                        'spent': self.__spent[endpoint],
+                        'requests': self.__requests[endpoint],
+                        'denied': self.__denied[endpoint],
+                    }
+                    for endpoint in set(self.__spent) | set(self.__denied)
+                }
+            }
+
+    def __refill(self):
+        """
+        Adds the quota units accumulated since the last refill, the condition lock must be held
+        """
+        now = time.monotonic()
+        self.__tokens = min(self.__capacity, self.__tokens + (now - self.__last_refill) * self.__refill_rate)
+        self.__last_refill = now
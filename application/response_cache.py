@@ -0,0 +1,343 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qsl, urlencode, urlunsplit
+
+from application.database import MongoDB
+from application.message_logger import MessageLogger
+
+RESPONSE_CACHE_BACKEND = 'sqlite'   # 'memory', 'sqlite' or 'mongo'
+RESPONSE_CACHE_FILE = ".cache.sqlite"
+MAX_ENTRIES = 50000                 # maximum number of cached responses, the least recently used are evicted
+DEFAULT_TTL = 24 * 60 * 60          # seconds a response of an endpoint without its own ttl is cached
+
+# seconds the responses of every endpoint are cached
+ENDPOINT_TTLS = {
+    'search': 6 * 60 * 60,
+    'channels': 24 * 60 * 60,
+    'playlists': 24 * 60 * 60,
+    'playlistItems': 6 * 60 * 60,
+    'videos': 60 * 60,
+    'commentThreads': 60 * 60,
+}
+
+
+class MemoryBackend:
+    """
+    Response cache backend that keeps the entries in the memory of the process
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        """
+        Class constructor
+        :param max_entries: the maximum number of entries
+        """
+        self.__max_entries = max_entries
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns an entry and marks it as recently used
+        :param key: the key of the entry
+        :return: tuple with the value and the expiration time or None
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                self.__entries.move_to_end(key)
+            return entry
+
+    def set(self, key, endpoint, value, expires):
+        """
+        Stores an entry and evicts the least recently used entries over the maximum size
+        :param key: the key of the entry
+        :param endpoint: the api endpoint of the response
+        :param value: the cached response
+        :param expires: the expiration time
+        :return: the number of evicted entries
+        """
+        with self.__lock:
+            self.__entries[key] = (value, expires)
+            self.__entries.move_to_end(key)
+            evicted = 0
+            while len(self.__entries) > self.__max_entries:
+                self.__entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def delete(self, key):
+        """
+        Removes an entry
+        :param key: the key of the entry
+        """
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def get_size(self):
+        """
+        Returns the number of entries
+        :return: the number of entries
+        """
+        with self.__lock:
+            return len(self.__entries)
+
+
+class SQLiteBackend:
+    """
+    Response cache backend that keeps the entries in a single SQLite file
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_FILE, max_entries=MAX_ENTRIES):
+        """
+        Class constructor
+        :param path: the path of the database file
+        :param max_entries: the maximum number of entries
+        """
+        self.__max_entries = max_entries
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, endpoint TEXT, value BLOB, expires REAL, accessed REAL)"
+        )
+        self.__connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def get(self, key):
+        """
+        Returns an entry and marks it as recently used
+        :param key: the key of the entry
+        :return: tuple with the value and the expiration time or None
+        """
+        with self.__lock:
+            row = self.__connection.execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.__connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            return row
+
+    def set(self, key, endpoint, value, expires):
+        """
+        Stores an entry and evicts the least recently used entries over the maximum size
+        :param key: the key of the entry
+        :param endpoint: the api endpoint of the response
+        :param value: the cached response
+        :param expires: the expiration time
+        :return: the number of evicted entries
+        """
+        with self.__lock:
+            self.__connection.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, value, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, endpoint, value, expires, time.time())
+            )
+            size = self.__connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if size <= self.__max_entries:
+                return 0
+            self.__connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                (size - self.__max_entries,)
+            )
+            return size - self.__max_entries
+
+    def delete(self, key):
+        """
+        Removes an entry
+        :param key: the key of the entry
+        """
+        with self.__lock:
+            self.__connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def get_size(self):
+        """
+        Returns the number of entries
+        :return: the number of entries
+        """
+        with self.__lock:
+            return self.__connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class MongoBackend:
+    """
+    Response cache backend that keeps the entries in a MongoDB collection shared by all the hosts
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, db=None):
+        """
+        Class constructor
+        :param max_entries: the maximum number of entries
+        :param db: the database connector, a new one is created if it is not set
+        """
+        self.__db = db if db is not None else MongoDB()
+        self.__max_entries = max_entries
+
+    def get(self, key):
+        """
+        Returns an entry and marks it as recently used
+        :param key: the key of the entry
+        :return: tuple with the value and the expiration time or None
+        """
+        entry = self.__db.get_cached_response(key)
+        if entry is None:
+            return None
+        return entry['value'], entry['expires']
+
+    def set(self, key, endpoint, value, expires):
+        """
+        Stores an entry and evicts the least recently used entries over the maximum size
+        :param key: the key of the entry
+        :param endpoint: the api endpoint of the response
+        :param value: the cached response
+        :param expires: the expiration time
+        :return: the number of evicted entries
+        """
+        self.__db.set_cached_response(key, endpoint, value, expires)
+        return self.__db.evict_cached_responses(self.__max_entries)
+
+    def delete(self, key):
+        """
+        Removes an entry
+        :param key: the key of the entry
+        """
+        self.__db.delete_cached_response(key)
+
+    def get_size(self):
+        """
+        Returns the number of entries
+        :return: the number of entries
+        """
+        return self.__db.count_cached_responses()
+
+
+class ResponseCache:
+    """
+    Cache of the api responses used by the http clients, it implements the get, set and delete methods that
+    httplib2 expects from a cache. The entries expire after the ttl of their endpoint and the backend evicts the
+    least recently used ones over its maximum size. The api key is removed from the cache keys, so the clients of
+    all the keys share the entries
+    """
+
+    def __init__(self, backend, endpoint_ttls=None, default_ttl=DEFAULT_TTL):
+        """
+        Class constructor
+        :param backend: the backend that stores the entries
+        :param endpoint_ttls: dictionary with the seconds the responses of every endpoint are cached
+        :param default_ttl: the seconds the responses of the other endpoints are cached
+        """
+        ml = MessageLogger('response_cache')
+        self.__logger = ml.get_logger()
+
+        self.__backend = backend
+        self.__endpoint_ttls = endpoint_ttls if endpoint_ttls is not None else ENDPOINT_TTLS
+        self.__default_ttl = default_ttl
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__expired = 0
+        self.__evictions = 0
+
+    def get(self, url):
+        """
+        Returns the cached response of a url
+        :param url: the url of the request
+        :return: the cached response or None
+        """
+        key, _ = self.__create_key(url)
+        entry = self.__backend.get(key)
+
+        expired = entry is not None and entry[1] < time.time()
+        if expired:
+            self.__backend.delete(key)
+
+        with self.__lock:
+            if entry is None or expired:
+                self.__misses += 1
+                self.__expired += int(expired)
+                return None
+            self.__hits += 1
+        return entry[0]
+
+    def set(self, url, value):
+        """
+        Stores the response of a url
+        :param url: the url of the request
+        :param value: the response with its headers
+        """
+        key, endpoint = self.__create_key(url)
+        ttl = self.__endpoint_ttls.get(endpoint, self.__default_ttl)
+        evicted = self.__backend.set(key, endpoint, value, time.time() + ttl)
+        if evicted:
+            with self.__lock:
+                self.__evictions += evicted
+
+    def delete(self, url):
+        """
+        Removes the response of a url
+        :param url: the url of the request
+        """
+        key, _ = self.__create_key(url)
+        self.__backend.delete(key)
+
+    def get_counters(self):
+        """
+        Returns the counters of the cache
+        :return: dictionary with the hits, misses, expired and evicted entries, the hit rate and the size
+        """
+        with self.__lock:
+            lookups = self.__hits + self.__misses
+            counters = {
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'expired': self.__expired,
+                'evictions': self.__evictions,
+                'hit rate': self.__hits / lookups if lookups else 0.0
+            }
+        counters['size'] = self.__backend.get_size()
+        return counters
+
+    @staticmethod
+    def __create_key(url):
+        """
+        Creates the key of a url without its api key
+        :param url: the url of the request
+        :return: tuple with the key and the endpoint of the request
+        """
+        parts = urlsplit(url)
+        query = urlencode(sorted((name, value) for name, value in parse_qsl(parts.query) if name != 'key'))
+        endpoint = parts.path.rstrip('/').rsplit('/', 1)[-1]
+        key = hashlib.sha1(urlunsplit(parts._replace(query=query)).encode()).hexdigest()
+        return key, endpoint
+
+
+def create_response_cache(backend=RESPONSE_CACHE_BACKEND, max_entries=MAX_ENTRIES, path=RESPONSE_CACHE_FILE):
+    """
+    Creates a response cache with a backend
+    :param backend: 'memory', 'sqlite' or 'mongo'
+    :param max_entries: the maximum number of cached responses
+    :param path: the database file of the sqlite backend
+    :return: the response cache
+    """
+    if backend == 'memory':
+        return ResponseCache(MemoryBackend(max_entries))
+    if backend == 'sqlite':
+        return ResponseCache(SQLiteBackend(path, max_entries))
+    if backend == 'mongo':
+        return ResponseCache(MongoBackend(max_entries))
+    raise ValueError("Invalid response cache backend: " + str(backend))
+
+
+__response_cache = None
+__response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Returns the response cache of the process, it is created the first time it is needed
+    :return: the response cache
+    """
+    global __response_cache
+    with __response_cache_lock:
+        if __response_cache is None:
+            __response_cache = create_response_cache()
+        return __response_cache
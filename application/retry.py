@@ -0,0 +1,111 @@
+import json
+import random
+import socket
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from application.message_logger import MessageLogger
+from application.quota_scheduler import QuotaExceededError
+
+# error classes
+RETRYABLE = 'retryable'             # transient failure, the same request can succeed later
+QUOTA = 'quota'                     # the quota of the api key is exhausted
+FATAL = 'fatal'                     # the request is invalid or the resource does not exist
+
+RETRYABLE_STATUSES = [429, 500, 502, 503, 504]
+RETRYABLE_REASONS = ['rateLimitExceeded', 'userRateLimitExceeded', 'backendError', 'internalError']
+QUOTA_REASONS = ['quotaExceeded', 'dailyLimitExceeded']
+
+MAX_ATTEMPTS = 5
+BASE_DELAY = 0.5                    # seconds before the first retry, doubled for every attempt
+MAX_DELAY = 30.0                    # maximum seconds between two attempts
+DEADLINE = 60.0                     # maximum seconds spent on a request, including the waiting
+
+
+def get_error_reason(error):
+    """
+    Extracts the reason of an api error, like 'quotaExceeded'
+    :param error: the HttpError
+    :return: the reason or an empty string
+    """
+    try:
+        content = json.loads(error.content.decode())
+        return content['error']['errors'][0]['reason']
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+        return ""
+
+
+def classify_error(error):
+    """
+    Classifies a request error as retryable, quota or fatal
+    :param error: the exception raised by the request
+    :return: the error class
+    """
+    if isinstance(error, QuotaExceededError):
+        return QUOTA
+    if isinstance(error, HttpError):
+        reason = get_error_reason(error)
+        if reason in QUOTA_REASONS:
+            return QUOTA
+        if reason in RETRYABLE_REASONS or error.resp.status in RETRYABLE_STATUSES:
+            return RETRYABLE
+        return FATAL
+    if isinstance(error, (socket.timeout, ConnectionError, httplib2.HttpLib2Error)):
+        return RETRYABLE
+    return FATAL
+
+
+class RetryPolicy:
+    """
+    Retries the transient request failures with exponential backoff and full jitter
+    """
+
+    def __init__(self, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY, deadline=DEADLINE):
+        """
+        Class constructor
+        :param max_attempts: the maximum number of attempts of a request
+        :param base_delay: the seconds before the first retry, doubled for every attempt
+        :param max_delay: the maximum seconds between two attempts
+        :param deadline: the maximum seconds spent on a request
+        """
+        ml = MessageLogger('retry')
+        self.__logger = ml.get_logger()
+
+        self.__max_attempts = max_attempts
+        self.__base_delay = base_delay
+        self.__max_delay = max_delay
+        self.__deadline = deadline
+
+    def call(self, function, *args, **kwargs):
+        """
+        Calls the function until it succeeds, it fails with a quota or fatal error, the attempts are exhausted or
+        the next attempt would pass the deadline. The last error is raised
+        :param function: the function that sends the request
+        :param args: the positional arguments of the function
+        :param kwargs: the keyword arguments of the function
+        :return: the result of the function
+        """
+        start = time.monotonic()
+        attempt = 0
+
+        while True:
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                attempt += 1
+                error_class = classify_error(e)
+                if error_class != RETRYABLE or attempt >= self.__max_attempts:
+                    raise
+
+                delay = random.uniform(0, min(self.__max_delay, self.__base_delay * 2 ** (attempt - 1)))
+                if time.monotonic() - start + delay > self.__deadline:
+                    raise
+
+                self.__logger.warning("Retrying request in %.2fs (attempt %d): %s" % (delay, attempt, str(e)))
+                time.sleep(delay)
+
+
+# policy used by the crawlers that do not set their own
+retry_policy = RetryPolicy()
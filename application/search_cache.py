@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+from application.message_logger import MessageLogger
+
+SEARCH_CACHE_TTL = 24 * 60 * 60     # seconds a search result is served from the cache
+EVICTION_INTERVAL = 60 * 60         # seconds between two removals of the expired search results
+
+
+class SearchCache:
+    """
+    Cache of the search results stored in the search_results collection. The entries are identified by a canonical
+    key, so equivalent searches share them, they expire after a ttl and a cached search with more results also
+    serves the searches with less results
+    """
+
+    def __init__(self, ttl=SEARCH_CACHE_TTL, eviction_interval=EVICTION_INTERVAL):
+        """
+        Class constructor
+        :param ttl: the number of seconds a search result is served from the cache
+        :param eviction_interval: the number of seconds between two removals of the expired entries
+        """
+        ml = MessageLogger('search_cache')
+        self.__logger = ml.get_logger()
+
+        self.__ttl = ttl
+        self.__eviction_interval = eviction_interval
+        self.__next_eviction = 0.0
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    @staticmethod
+    def create_key(keyword, order, search_type, location_radius, content_type):
+        """
+        Creates the canonical key of a search. The keyword is compared without case and extra whitespace and the
+        content types without their order
+        :param keyword: the search keyword or location
+        :param order: the order of the results
+        :param search_type: 'keyword' or 'location'
+        :param location_radius: the radius of a location search
+        :param content_type: the list of content types
+        :return: the key of the search
+        """
+        return json.dumps({
+            'keyword': ' '.join(keyword.lower().split()),
+            'order': order,
+            'search_type': search_type,
+            'location_radius': location_radius if search_type == 'location' else None,
+            'content_type': sorted(set(content_type)),
+        }, sort_keys=True)
+
+    def get(self, db, key, nr_results):
+        """
+        Returns the newest cached search with the key that is not expired and has at least nr_results results.
+        A search with more results is trimmed to nr_results and stored with its own id, so the crawl and the
+        network of the hit only cover the requested results. The trimmed copy keeps the cache key in trimmedFrom
+        instead of cacheKey, so the cache keeps serving the full search and the copy expires with it. The expired
+        entries are removed at most once every eviction interval
+        :param db: the database connector
+        :param key: the key of the search
+        :param nr_results: the number of requested results
+        :return: the search document with the first nr_results results or None
+        """
+        min_date = datetime.utcnow() - timedelta(seconds=self.__ttl)
+        self.__evict(db, min_date)
+        document = db.find_cached_search_results(key, nr_results, min_date)
+
+        with self.__lock:
+            if document is None:
+                self.__misses += 1
+                return None
+            self.__hits += 1
+
+        if len(document['results']) > nr_results:
+            document['_id'] = document['_id'] + '/' + str(nr_results)
+            document['results'] = document['results'][:nr_results]
+            document['selectedNrResults'] = nr_results
+            document['trimmedFrom'] = document.pop('cacheKey', None)
+            db.replace_search_results(document)
+        return document
+
+    def __evict(self, db, min_date):
+        """
+        Removes the expired entries if the eviction interval has passed since the last removal
+        :param db: the database connector
+        :param min_date: the minimum retrieval date that is kept
+        """
+        with self.__lock:
+            now = time.monotonic()
+            if now < self.__next_eviction:
+                return
+            self.__next_eviction = now + self.__eviction_interval
+
+        evicted = db.delete_expired_search_results(min_date)
+        if evicted:
+            self.__logger.info("Evicted " + str(evicted) + " expired search results")
+        with self.__lock:
+            self.__evictions += evicted
+
+    def peek(self, db, key, nr_results):
+        """
+        Returns the cached search like get, without counting the lookup, without storing a trimmed copy and
+        without removing the expired entries. It is used by the crawl planner
+        :param db: the database connector
+        :param key: the key of the search
+        :param nr_results: the number of requested results
+        :return: the search document with the first nr_results results or None
+        """
+        min_date = datetime.utcnow() - timedelta(seconds=self.__ttl)
+        document = db.find_cached_search_results(key, nr_results, min_date)
+        if document is None:
+            return None
+
+        document['results'] = document['results'][:nr_results]
+        return document
+
+    def put(self, db, key, document):
+        """
+        Stores a search in the cache
+        :param db: the database connector
+        :param key: the key of the search
+        :param document: the search document
+        """
+        document['cacheKey'] = key
+        db.replace_search_results(document)
+
+    def get_counters(self):
+        """
+        Returns the counters of the cache
+        :return: dictionary with the hits, misses, evictions and the hit rate
+        """
+        with self.__lock:
+            lookups = self.__hits + self.__misses
+            return {
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'evictions': self.__evictions,
+                'hit rate': self.__hits / lookups if lookups else 0.0
+            }
+
+
+# search cache shared by all the crawlers of the process
+search_cache = SearchCache()
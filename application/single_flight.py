@@ -0,0 +1,125 @@
+import threading
+
+
+class _Call:
+    """
+    A call that is in progress and the result it shares with the waiting callers
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical calls that run at the same time: the first caller runs the function and the callers that
+    arrive while it is running wait for it and receive the same result
+    """
+
+    def __init__(self):
+        """
+        Class constructor
+        """
+        self.__lock = threading.Lock()
+        self.__calls = {}
+        self.__executed = 0                 # number of calls that ran the function
+        self.__shared = 0                   # number of calls that received the result of another call
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Runs the function once for all the concurrent calls with the same key
+        :param key: the key that identifies identical calls
+        :param function: the function to run
+        :param args: the positional arguments of the function
+        :param kwargs: the keyword arguments of the function
+        :return: the result of the function
+        """
+        with self.__lock:
+            call = self.__calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.__calls[key] = call
+                self.__executed += 1
+            else:
+                self.__shared += 1
+
+        if leader:
+            try:
+                call.result = function(*args, **kwargs)
+            except Exception as e:
+                call.error = e
+            finally:
+                with self.__lock:
+                    del self.__calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do_many(self, keys, function):
+        """
+        Runs a function that handles several keys at once, such as an http batch, once for all the concurrent calls.
+        The keys that are already in flight are not passed to the function, their callers wait for the running calls
+        :param keys: the keys that identify the calls
+        :param function: the function that receives the list of keys it runs and returns a dictionary with the result
+        or the exception of every key
+        :return: dictionary with the result or the exception of every key
+        """
+        led = {}
+        joined = {}
+        with self.__lock:
+            for key in keys:
+                if key in led or key in joined:
+                    continue
+                call = self.__calls.get(key)
+                if call is None:
+                    call = _Call()
+                    self.__calls[key] = call
+                    led[key] = call
+                    self.__executed += 1
+                else:
+                    joined[key] = call
+                    self.__shared += 1
+
+        if led:
+            values = {}
+            try:
+                values = function(list(led))
+            except Exception as e:
+                values = {key: e for key in led}
+            finally:
+                for key, call in led.items():
+                    value = values.get(key)
+                    if isinstance(value, Exception):
+                        call.error = value
+                    else:
+                        call.result = value
+                with self.__lock:
+                    for key in led:
+                        del self.__calls[key]
+                for call in led.values():
+                    call.done.set()
+
+        results = {}
+        for key, call in list(led.items()) + list(joined.items()):
+            call.done.wait()
+            results[key] = call.error if call.error is not None else call.result
+        return results
+
+    def get_counters(self):
+        """
+        Returns the number of executed and shared calls
+        :return: dictionary with the counters
+        """
+        with self.__lock:
+            return {'executed': self.__executed, 'shared': self.__shared, 'in flight': len(self.__calls)}
+
+
+# coalesces the requests of all the crawlers of the process
+flights = SingleFlight()
@@ -1,25 +1,71 @@
+import hashlib
+import json
 import math
 import os
 import pickle
+import queue
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
 from datetime import datetime
+from functools import partial
 from pymongo import errors
 
-import httplib2
-from dotenv import load_dotenv
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from application.api_service import get_service_factory
+from application.comment_budget import allocate_comment_pages
+from application.crawl_planner import estimate_crawl
 from application.message_logger import MessageLogger
 from application.database import MongoDB
-
-load_dotenv()
-DEVELOPER_KEY = os.getenv('GOOGLE_DEV_KEY')
-YOUTUBE_API_SERVICE_NAME = 'youtube'
-YOUTUBE_API_VERSION = 'v3'
+from application.key_pool import key_pool as default_key_pool
+from application.quota_scheduler import QuotaExceededError
+from application.retry import classify_error, QUOTA, FATAL, retry_policy as default_retry_policy
+from application.search_cache import search_cache as default_search_cache
+from application.single_flight import flights
 
 TEXT_EXTENSION = '.txt'
 OBJECT_EXTENSION = '.pickle'
 
+DEFAULT_CONCURRENCY = 8
+STATISTICS_CHUNK_SIZE = 50                                  # maximum number of ids accepted by a list request
+TOKEN_LEASE_SECONDS = 10 * 60                               # time a claimed page token is reserved for a worker
+
+REQUEST_ERRORS = (HttpError, QuotaExceededError)
+
+# partial response masks with the fields that are read from every endpoint, the text fields are optional
+FIELD_MASKS = {
+    'search': 'etag,nextPageToken,pageInfo/totalResults,'
+              'items(id,snippet(title,{description}publishedAt,channelId,channelTitle))',
+    'channels': 'etag,nextPageToken,items(id,snippet(title,{description}publishedAt),statistics)',
+    'playlists': 'etag,nextPageToken,items(id,snippet(title,{description}publishedAt))',
+    'playlistItems': 'etag,nextPageToken,'
+                     'items(snippet(resourceId/videoId,channelId,title,{description}publishedAt))',
+    'videos': 'etag,nextPageToken,items(id,statistics)',
+    'commentThreads': 'etag,nextPageToken,'
+                      'items(id,snippet/topLevelComment/snippet({comment}),replies/comments(id,snippet({comment})))',
+}
+COMMENT_FIELDS = 'videoId,authorDisplayName,authorChannelId,{text}likeCount,publishedAt'
+
+# partial response of the channels requests that resolve the uploads playlists
+UPLOADS_FIELDS = 'etag,items(id,contentDetails/relatedPlaylists/uploads)'
+
+MAX_BATCH_SIZE = 1000                                       # maximum number of requests in an http batch
+
+# channel expansion modes - every playlist of a channel or only the playlist with its uploads
+CHANNEL_EXPANSIONS = ['playlists', 'uploads']
+
+# endpoints that are requested with If-None-Match when the etag of the page is known
+CONDITIONAL_ENDPOINTS = ['channels', 'playlists', 'playlistItems', 'videos', 'commentThreads']
+PENDING_ETAG = 'pendingEtag'                                # field of a page that holds its etag until it is stored
+
+
+class CrawlStoppedError(Exception):
+    """
+    Raised by the requests of a crawler that was stopped, it ends the running crawl tasks
+    """
+
 
 class YoutubeAPI:
     """
@@ -28,24 +74,69 @@ class YoutubeAPI:
 
     """ Init """
 
-    def __init__(self, file_name, path, comment_pages_limit):
+    def __init__(self, file_name, path, comment_pages_limit, concurrency=DEFAULT_CONCURRENCY, service=None,
+                 key_pool=None, incremental_comments=False, include_text=True, adaptive_comments=False,
+                 retry_policy=None, search_cache=None, channel_expansion='playlists', channel_videos_limit=None,
+                 batch_size=0, write_batch_size=0, skip_unchanged=False):
         """
 
         :param file_name:
         :param path:
         :param comment_pages_limit:
+        :param concurrency: the maximum number of api requests that are running at the same time
+        :param service: thread safe api service used instead of the youtube api (e.g. FakeYoutubeService)
+        :param key_pool: the api keys and their quota, the keys shared by the process are used if it is not set
+        :param incremental_comments: get only the comments published since the last crawl of a video
+        :param include_text: request the descriptions and the comment texts, they are stored empty otherwise
+        :param adaptive_comments: split the comment pages across the videos by their comment count
+        :param retry_policy: the retry policy of the requests, the default policy is used if it is not set
+        :param search_cache: the search results cache, the one shared by the process is used if it is not set
+        :param channel_expansion: 'playlists' crawls every playlist of a channel, 'uploads' only the uploads playlist
+        :param channel_videos_limit: the maximum number of videos of a channel crawled in 'uploads' mode
+        :param batch_size: the maximum number of first page requests sent in one http batch, 0 disables batching
+        :param write_batch_size: the number of database writes sent in one bulk write, 0 writes every document
+        immediately
+        :param skip_unchanged: skip the database writes of the documents whose content did not change
         """
         ml = MessageLogger('youtube_api')
         self.__logger = ml.get_logger()
         try:
-            self.__db = MongoDB()                               # mongodb driver
+            self.__db = MongoDB(write_batch_size, skip_unchanged=skip_unchanged)  # mongodb driver
         except errors.ConnectionFailure:
             raise errors.ConnectionFailure
         self.__max_results = 0                              # the maximum number of results
-        self.__get_authentication_service()                 # get the authentication service for youtube api
+        self.__service = service
+        self.__key_pool = key_pool if key_pool is not None else default_key_pool
+        self.__retry_policy = retry_policy if retry_policy is not None else default_retry_policy
+        self.__search_cache = search_cache if search_cache is not None else default_search_cache
         self.__file_name = file_name
         self.__path = path
         self.__comment_pages_limit = comment_pages_limit
+        self.__concurrency = max(1, concurrency)
+        self.__incremental_comments = incremental_comments
+        self.__adaptive_comments = adaptive_comments
+        self.__field_masks = self.__create_field_masks(include_text)
+        if channel_expansion not in CHANNEL_EXPANSIONS:
+            raise ValueError("Invalid channel expansion: " + str(channel_expansion))
+        self.__channel_expansion = channel_expansion
+        self.__channel_videos_limit = channel_videos_limit
+        self.__batch_size = min(max(0, batch_size), MAX_BATCH_SIZE)
+        self.__etags = {}                                   # request key: etag document loaded in bulk or None
+        self.__etags_lock = threading.Lock()
+        self.__stopped = threading.Event()
+
+    def stop(self):
+        """
+        Stops the crawl, the next request of every running task raises CrawlStoppedError
+        """
+        self.__stopped.set()
+
+    def __check_stopped(self):
+        """
+        Raises CrawlStoppedError if the crawler was stopped
+        """
+        if self.__stopped.is_set():
+            raise CrawlStoppedError("Crawl " + self.__file_name + " was stopped")
 
     """ Search data """
 
@@ -94,17 +185,12 @@ class YoutubeAPI:
         for s in content_type:
             content_str += s + ','
 
-        search_query = {
-            'keyword': keyword,
-            'pageToken': page_token,
-            'selectedNrResults': nr_results,
-            'order': order,
-            'search_type': search_type,
-            'location_radius': location_radius,
-            'content_type': content_type
-        }
+        # only the first page of a search is cached, the page tokens continue older searches
+        cache_key = None
+        if not page_token:
+            cache_key = self.__search_cache.create_key(keyword, order, search_type, location_radius, content_type)
 
-        search_results = self.__check_search_cache(search_query)
+        search_results = self.__check_search_cache(cache_key, nr_results)
 
         if not search_results:
             self.__logger.info("Requesting data from youtube api")
@@ -139,177 +225,510 @@ class YoutubeAPI:
                 'results': results
             })
 
-            self.__write_search_cache(search_results)
+            self.__write_search_cache(cache_key, search_results)
 
         return search_results
 
     """ Process data """
 
-    def process_search_results(self, search_results):
+    def process_search_results(self, search_results, on_video_done=None):
         """
-
+        Crawls the resources from the search results. The playlists, playlist videos and comments of the results
+        are requested concurrently, with at most `concurrency` requests running at the same time
         :param search_results:
+        :param on_video_done: function called with the video id when the comments of a video were crawled
         :return:
         """
 
-        videos_list = []
-        channels_list = []
-
         if not search_results:
             self.__logger.warning("Search results are empty")
             return
 
-        for item in search_results[0]['results']:
-            title = item['snippet']['title']
-            description = item['snippet']['description']
-            published_at = item['snippet']['publishedAt']
-            kind = item['id']['kind']
-
-            if kind == 'youtube#channel':
-                self.__logger.info("[RESULT] Channel: " + title)
+        # the buffered writes of the finished pages are also kept when a task fails or the crawl is stopped
+        try:
+            self.__crawl_search_results(search_results, on_video_done)
+        finally:
+            self.__db.flush()
+        self.__logger.info("Quota counters: " + str(self.get_quota_counters()))
+        self.__logger.info("Write counters: " + str(self.__db.get_write_counters()))
 
-                channel_id = item['id']['channelId']
-                channels_list.append(channel_id)
+    def __crawl_search_results(self, search_results, on_video_done):
+        """
+        Crawls the resources of the search results and their statistics
+        :param search_results: the search results
+        :param on_video_done: function called with the video id when the comments of a video were crawled
+        """
 
-                playlists = self.__get_channel_playlists(
-                    part='snippet',
-                    channelId=channel_id,
-                    maxResults=50
-                )
-                if playlists is False:
-                    return
-                for pl in playlists:
-                    self.__db.insert_playlist(pl)
-                    self.__get_playlist_videos(
+        videos_list = []
+        channels_list = []
+        tasks = {}
+        callbacks = {}
+
+        # the uploads expansion waits for its own requests, it runs on a separate thread so it does not hold back
+        # the comment tasks and their callbacks
+        with ThreadPoolExecutor(max_workers=self.__concurrency) as executor, \
+                ThreadPoolExecutor(max_workers=1) as expansion:
+            for item in search_results[0]['results']:
+                title = item['snippet']['title']
+                description = item['snippet'].get('description', "")
+                published_at = item['snippet']['publishedAt']
+                kind = item['id']['kind']
+
+                if kind == 'youtube#channel':
+                    self.__logger.info("[RESULT] Channel: " + title)
+
+                    channel_id = item['id']['channelId']
+                    channels_list.append(channel_id)
+
+                    self.__db.insert_channel({
+                        "_id": channel_id,
+                        "title": title,
+                        "description": description,
+                        "publishedAt": published_at,
+                        "retrieval date": datetime.utcnow(),
+                    })
+
+                    if self.__channel_expansion == 'playlists':
+                        task = executor.submit(self.__crawl_channel, executor, channel_id)
+                        tasks[task] = "channel [" + channel_id + "]"
+
+                if kind == 'youtube#playlist':
+                    self.__logger.info("[RESULT] Playlist: " + title)
+
+                    playlist_id = item['id']['playlistId']
+
+                    self.__db.insert_playlist({
+                        "_id": playlist_id,
+                        "title": title,
+                        "description": description,
+                        "publishedAt": published_at,
+                        "retrieval date": datetime.utcnow(),
+                    })
+
+                    task = executor.submit(
+                        self.__coalesce,
+                        self.__get_playlist_videos,
                         part='snippet',
-                        playlistId=pl['_id'],
+                        playlistId=playlist_id,
                         maxResults=50
                     )
-
-                self.__db.insert_channel({
-                    "_id": channel_id,
-                    "title": title,
-                    "description": description,
-                    "publishedAt": published_at,
-                    "retrieval date": datetime.utcnow(),
+                    tasks[task] = "playlist [" + playlist_id + "]"
+
+                elif kind == 'youtube#video':
+                    self.__logger.info("[RESULT] Video: " + title)
+
+                    video_id = item['id']['videoId']
+                    channel_id = item['snippet']['channelId']
+                    videos_list.append(video_id)
+
+                    self.__db.insert_video({
+                        "_id": video_id,
+                        "channelId": channel_id,
+                        "title": title,
+                        "description": description,
+                        "publishedAt": published_at,
+                        "retrieval date": datetime.utcnow()
+                    })
+
+            comment_pages = self.__allocate_comment_pages(videos_list)
+            first_pages = {}
+            if self.__batch_size and not self.__incremental_comments:
+                first_pages = self.__get_first_pages('commentThreads', {
+                    video_id: self.__video_comments_query(video_id)
+                    for video_id in videos_list if comment_pages[video_id] > 0
                 })
+            elif not self.__incremental_comments:
+                self.__load_etags('commentThreads', [
+                    self.__video_comments_query(video_id) for video_id in videos_list if comment_pages[video_id] > 0
+                ])
+
+            for video_id in videos_list:
+                if self.__incremental_comments:
+                    task = executor.submit(self.__coalesce, self.__get_new_video_comments, video_id,
+                                           comment_pages[video_id])
+                else:
+                    task = executor.submit(self.__coalesce, self.__get_video_comments, comment_pages[video_id],
+                                           first_page=first_pages.get(video_id),
+                                           **self.__video_comments_query(video_id))
+                tasks[task] = "video [" + video_id + "]"
+                if on_video_done is not None:
+                    callbacks[task] = partial(on_video_done, video_id)
 
-            if kind == 'youtube#playlist':
-                self.__logger.info("[RESULT] Playlist: " + title)
+            if self.__channel_expansion == 'uploads' and channels_list:
+                task = expansion.submit(self.__crawl_uploads, executor, channels_list, videos_list)
+                tasks[task] = "uploads of " + str(len(channels_list)) + " channels"
 
-                playlist_id = item['id']['playlistId']
+            self.__wait_tasks(tasks, callbacks)
 
-                self.__db.insert_playlist({
-                    "_id": playlist_id,
-                    "title": title,
-                    "description": description,
-                    "publishedAt": published_at,
-                    "retrieval date": datetime.utcnow(),
-                })
+        if videos_list and not self.__adaptive_comments:
+            self.__get_statistics('videos', videos_list)
 
-                self.__get_playlist_videos(
-                    part='snippet',
-                    playlistId=playlist_id,
-                    maxResults=50
-                )
+        if channels_list:
+            self.__get_statistics('channels', channels_list)
 
-            elif kind == 'youtube#video':
-                self.__logger.info("[RESULT] Video: " + title)
+    def get_quota_counters(self):
+        """
+        Returns the live quota counters of the api keys used by the crawler
+        :return: dictionary with the spent and remaining quota units of the pool and of every key
+        """
+        return self.__key_pool.get_counters()
 
-                video_id = item['id']['videoId']
-                channel_id = item['snippet']['channelId']
-                videos_list.append(video_id)
+    def plan_search(self, keyword, nr_results=50, order='relevance', search_type='keyword', location_radius='100km',
+                    content_type=None):
+        """
+        Estimates the cost of a search and of its crawl without sending any request. A search served by the search
+        cache is planned from its results and the stored statistics of its videos and channels, the results of an
+        uncached search are counted as videos without statistics, which is the most expensive case
+        :param keyword: the search keyword or location
+        :param nr_results: the number of search results
+        :param order: the order of the results
+        :param search_type: 'keyword' or 'location'
+        :param location_radius: the radius of a location search
+        :param content_type: the list of content types
+        :return: dictionary with the estimated requests, quota units, round trips, edges and seconds and the
+        remaining quota units of the api keys
+        """
 
-                self.__db.insert_video({
-                    "_id": video_id,
-                    "channelId": channel_id,
-                    "title": title,
-                    "description": description,
-                    "publishedAt": published_at,
-                    "retrieval date": datetime.utcnow()
-                })
+        if content_type is None:
+            content_type = ['video', 'channel', 'playlist']
+        cache_key = self.__search_cache.create_key(keyword, order, search_type, location_radius, content_type)
+        document = self.__search_cache.peek(self.__db, cache_key, nr_results)
+
+        videos = {}
+        channels = {}
+        nr_playlists = 0
+        if document is None:
+            videos = {index: None for index in range(nr_results)}
+        else:
+            for item in document['results']:
+                kind = item['id']['kind']
+                if kind == 'youtube#video':
+                    videos[item['id']['videoId']] = None
+                elif kind == 'youtube#channel':
+                    channels[item['id']['channelId']] = None
+                elif kind == 'youtube#playlist':
+                    nr_playlists += 1
+            for video_id, statistics in self.__db.get_video_statistics(list(videos)).items():
+                videos[video_id] = statistics.get('commentCount')
+            for channel_id, statistics in self.__db.get_channel_statistics(list(channels)).items():
+                channels[channel_id] = statistics.get('videoCount')
+
+        plan = estimate_crawl(nr_results, document is not None, videos, channels, nr_playlists,
+                              self.__comment_pages_limit, self.__adaptive_comments, self.__channel_expansion,
+                              self.__channel_videos_limit, self.__batch_size, self.__concurrency)
+        plan['remaining'] = self.__key_pool.get_counters()['remaining']
+        self.__logger.info("Crawl plan for [" + keyword + "]: " + str(plan))
+
+        return plan
+
+    def __coalesce(self, function, *args, **kwargs):
+        """
+        Runs a crawl function once for the identical calls of all the crawlers of the process that are running at
+        the same time, so they share the requests and the database writes. The writes buffered by the call are
+        flushed before its result is shared, the other crawlers read them from the database. A first page that was
+        requested in a batch is not part of the key, the same page is shared by the batches of the crawlers
+        :param function: the crawl function
+        :param args: the positional arguments of the function
+        :param kwargs: the keyword arguments of the function
+        :return: the result of the function
+        """
+
+        def run():
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.__db.flush()
+
+        self.__check_stopped()
+        key = self.__request_key(function.__name__,
+                                 [args, {name: value for name, value in kwargs.items() if name != 'first_page'}])
+        try:
+            return flights.do(key, run)
+        except CrawlStoppedError:
+            # the call was led by another crawler that was stopped
+            if self.__stopped.is_set():
+                raise
+            return function(*args, **kwargs)
+
+    def __allocate_comment_pages(self, videos_list):
+        """
+        Computes the number of comment pages crawled for every video. In adaptive mode the statistics of the videos
+        are requested first and the budget of comment_pages_limit pages per video is split across the videos
+        proportionally to their comment count. The pages that are cut off stay in the tokens backlog
+        :param videos_list: the list of video ids
+        :return: dictionary with the number of comment pages of every video
+        """
+
+        if not self.__adaptive_comments:
+            return {video_id: self.__comment_pages_limit for video_id in videos_list}
+
+        statistics = self.__get_statistics('videos', videos_list)
+        comment_counts = {
+            video_id: statistics[video_id]['commentCount'] if video_id in statistics else None
+            for video_id in videos_list
+        }
+        comment_pages = allocate_comment_pages(comment_counts, self.__comment_pages_limit * len(videos_list))
+        self.__logger.info("Comment pages: " + str(comment_pages))
+
+        return comment_pages
+
+    def __crawl_channel(self, executor, channel_id):
+        """
+        Gets the playlists of a channel and schedules the crawling of the playlist videos on the executor
+        :param executor: the executor that runs the playlist videos requests
+        :param channel_id: the id of the channel
+        :return: the scheduled tasks or False if the playlists cannot be obtained
+        """
+
+        tasks = {}
 
-                self.__get_video_comments(
-                    part='snippet,replies',
-                    videoId=video_id,
-                    textFormat='plainText',
-                    maxResults=100,
-                    order='relevance'
+        playlists = self.__coalesce(self.__store_channel_playlists, channel_id)
+        if playlists is False:
+            return False
+        for pl in playlists:
+            task = executor.submit(
+                self.__coalesce,
+                self.__get_playlist_videos,
+                part='snippet',
+                playlistId=pl['_id'],
+                maxResults=50
+            )
+            tasks[task] = "playlist [" + pl['_id'] + "]"
+
+        return tasks
+
+    def __crawl_uploads(self, executor, channels_list, known_videos):
+        """
+        Crawls the uploads playlists of the channels. The video ids are de-duplicated across the channels and
+        against the known videos before the new videos are written and their statistics are requested
+        :param executor: the executor that runs the playlist items requests
+        :param channels_list: the list of channel ids
+        :param known_videos: the ids of the videos that are already crawled
+        :return: the list with the ids of the new videos
+        """
+
+        uploads = self.__get_uploads_playlists(channels_list)
+        first_pages = {}
+        if self.__batch_size:
+            first_pages = self.__get_first_pages('playlistItems', {
+                channel_id: self.__uploads_query(playlist_id, self.__channel_videos_limit)
+                for channel_id, playlist_id in uploads.items()
+            })
+        else:
+            self.__load_etags('playlistItems', [
+                self.__uploads_query(playlist_id, self.__channel_videos_limit) for playlist_id in uploads.values()
+            ])
+
+        tasks = {}
+        for channel_id, playlist_id in uploads.items():
+            task = executor.submit(self.__coalesce, self.__get_uploads_videos, playlist_id,
+                                   self.__channel_videos_limit, first_page=first_pages.get(channel_id))
+            tasks[task] = channel_id
+
+        seen = set(known_videos)
+        new_videos = []
+        for task, channel_id in tasks.items():
+            result = task.result()
+            if result is False:
+                self.__logger.error("Crawling failed for uploads of channel [" + channel_id + "]")
+                continue
+            videos, pages = result
+            for video in videos:
+                if video['_id'] in seen:
+                    continue
+                seen.add(video['_id'])
+                self.__db.insert_video(video)
+                new_videos.append(video['_id'])
+            for results in pages:
+                self.__commit_etag(results)
+
+        self.__logger.info("Channel uploads: " + str(len(new_videos)) + " new videos from " + str(len(uploads)) +
+                           " channels")
+        if new_videos:
+            self.__get_statistics('videos', new_videos)
+
+        return new_videos
+
+    def __get_uploads_playlists(self, channels_list):
+        """
+        Returns the uploads playlist of every channel. The playlists that are not stored yet are requested for
+        STATISTICS_CHUNK_SIZE channels at a time and stored with the channels
+        :param channels_list: the list of channel ids
+        :return: dictionary with the uploads playlist id of every resolved channel
+        """
+
+        uploads = self.__db.get_uploads_playlists(channels_list)
+        missing = [channel_id for channel_id in channels_list if channel_id not in uploads]
+
+        resolved = {}
+        pages = []
+        for i in range(0, len(missing), STATISTICS_CHUNK_SIZE):
+            try:
+                results = self.__execute(
+                    'channels',
+                    part='contentDetails',
+                    id=','.join(missing[i:i + STATISTICS_CHUNK_SIZE]),
+                    maxResults=STATISTICS_CHUNK_SIZE,
+                    fields=UPLOADS_FIELDS
                 )
+            except REQUEST_ERRORS as e:
+                self.__logger.error("Request error: " + str(e))
+                continue
+            for item in results['items']:
+                resolved[item['id']] = item['contentDetails']['relatedPlaylists']['uploads']
+            pages.append(results)
 
-        if videos_list:
-            videos_id_str = ','.join(videos_list)
-            self.__get_video_statistics(part='statistics', id=videos_id_str, maxResults=self.__max_results)
+        self.__db.insert_uploads_playlists(resolved)
+        for results in pages:
+            self.__commit_etag(results)
+        uploads.update(resolved)
 
-        if channels_list:
-            channels_id_str = ','.join(channels_list)
-            self.__get_channel_statistics(part='statistics', id=channels_id_str, maxResults=50)
+        return uploads
 
-    def process_tokens(self, nr_results, content_type=None, location_radius=None, order="relevance"):
+    def __store_channel_playlists(self, channel_id):
+        """
+        Gets the playlists of a channel, they are written in the database page by page
+        :param channel_id: the id of the channel
+        :return: the list of playlists or False if the playlists cannot be obtained
+        """
+
+        return self.__get_channel_playlists(
+            part='snippet',
+            channelId=channel_id,
+            maxResults=50
+        )
+
+    def __wait_tasks(self, tasks, callbacks=None):
+        """
+        Waits for the crawl tasks to finish, including the tasks that are scheduled by the running ones
+        :param tasks: dictionary with the running tasks and their description
+        :param callbacks: dictionary with the functions that are called when a task finishes
         """
 
+        pending = set(tasks)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                if callbacks and task in callbacks:
+                    callbacks[task]()
+                if result is False:
+                    self.__logger.error("Crawling failed for " + tasks[task])
+                elif isinstance(result, dict):
+                    tasks.update(result)
+                    pending.update(result)
+
+    def process_tokens(self, nr_results, content_type=None, location_radius=None, order="relevance", workers=1,
+                       lease_seconds=TOKEN_LEASE_SECONDS):
+        """
+        Drains the page tokens backlog with a pool of worker threads. Every worker claims a token with a lease,
+        processes it and removes it. The token of a failed or crashed worker goes back to the backlog when its
+        lease expires
         :param nr_results:
         :param content_type:
         :param location_radius:
         :param order:
-        :return:
+        :param workers: the number of worker threads
+        :param lease_seconds: the number of seconds a claimed token is reserved for a worker
+        :return: the number of processed tokens
         """
 
         self.__max_results = 50
 
-        tokens = self.__db.get_tokens()
-
-        if tokens and tokens.count() > 0:
-            self.__logger.info("Processing remaining page tokens:")
-            for t in tokens:
-                token_type = t['type']
-                args = t['query']
-                token_id = t['_id']
-                args['pageToken'] = token_id
-                result_success = False
-
-                self.__logger.info(" > " + token_type + " token [" + token_id + "]")
-
-                if token_type == "search":
-                    keyword = t['keyword']
-                    if 'order' in t['query']:
-                        order = t['query']['order']
-                    if 'q' in t['query']:
-                        result_success = self.search(keyword, nr_results, location_radius=location_radius, order=order,
-                                                     search_type='keyword', page_token=token_id,
-                                                     content_type=content_type)
-                    elif 'location' in t['query']:
-                        result_success = self.search(keyword, nr_results, location_radius=location_radius, order=order,
-                                                     search_type='location', page_token=token_id,
-                                                     content_type=content_type)
-
-                elif token_type == 'channel_statistics':
-                    result_success = self.__get_channel_statistics(**args)
-
-                elif token_type == 'channel_playlists':
-                    playlists = self.__get_channel_playlists(**args)
-                    if playlists is False:
-                        return
-                    for pl in playlists:
-                        self.__db.insert_playlist(pl)
+        worker_prefix = socket.gethostname() + "-" + str(os.getpid()) + "-"
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                results = executor.map(
+                    lambda worker_id: self.__token_worker(worker_id, lease_seconds, nr_results, content_type,
+                                                          location_radius, order),
+                    [worker_prefix + str(i) for i in range(max(1, workers))]
+                )
+                nr_processed = sum(results)
+        finally:
+            self.__db.flush()
 
-                elif token_type == 'playlist_videos':
-                    result_success = self.__get_playlist_videos(**args)
+        if nr_processed == 0:
+            self.__logger.warning("No remaining tokens!")
 
-                elif token_type == 'video_statistics':
-                    result_success = self.__get_video_statistics(**args)
+        return nr_processed
 
-                elif token_type == 'video_comments':
-                    result_success = self.__get_video_comments(**args)
+    def __token_worker(self, worker_id, lease_seconds, nr_results, content_type, location_radius, order):
+        """
+        Claims and processes tokens until the backlog has no available token
+        :param worker_id: the id of the worker that holds the leases
+        :param lease_seconds: the number of seconds a claimed token is reserved for the worker
+        :param nr_results:
+        :param content_type:
+        :param location_radius:
+        :param order:
+        :return: the number of processed tokens
+        """
 
-                else:
-                    pass
+        nr_processed = 0
+
+        token = self.__db.claim_token(worker_id, lease_seconds)
+        while token:
+            token_id = token['_id']
+            self.__logger.info(" > [" + worker_id + "] " + token['type'] + " token [" + token_id + "]")
+
+            if self.__process_token(token, nr_results, content_type, location_radius, order) is not False:
+                self.__logger.info(" > Removing token [" + token_id + "]")
+                self.__db.remove_token(token_id)
+                nr_processed += 1
+
+            token = self.__db.claim_token(worker_id, lease_seconds)
+
+        return nr_processed
+
+    def __process_token(self, t, nr_results, content_type, location_radius, order):
+        """
+        Requests the data of a page token
+        :param t: the token document
+        :param nr_results:
+        :param content_type:
+        :param location_radius:
+        :param order:
+        :return: False if the data cannot be obtained
+        """
+
+        token_type = t['type']
+        args = t['query']
+        token_id = t['_id']
+        args['pageToken'] = token_id
+        result_success = False
+
+        if token_type == "search":
+            keyword = t['keyword']
+            if 'order' in t['query']:
+                order = t['query']['order']
+            if 'q' in t['query']:
+                result_success = self.search(keyword, nr_results, location_radius=location_radius, order=order,
+                                             search_type='keyword', page_token=token_id,
+                                             content_type=content_type)
+            elif 'location' in t['query']:
+                result_success = self.search(keyword, nr_results, location_radius=location_radius, order=order,
+                                             search_type='location', page_token=token_id,
+                                             content_type=content_type)
+
+        elif token_type == 'channel_statistics':
+            result_success = self.__get_channel_statistics(**args)
+
+        elif token_type == 'channel_playlists':
+            result_success = self.__get_channel_playlists(**args) is not False
+
+        elif token_type == 'playlist_videos':
+            result_success = self.__get_playlist_videos(**args)
+
+        elif token_type == 'video_statistics':
+            result_success = self.__get_video_statistics(**args)
+
+        elif token_type == 'video_comments':
+            result_success = self.__get_video_comments(**args)
 
-                if result_success is not False:
-                    self.__logger.info(" > Removing token [" + token_id + "]")
-                    self.__db.remove_token(token_id)
         else:
-            self.__logger.warning("No remaining tokens!")
+            pass
+
+        return result_success
 
     def get_channel_data(self):
         """
@@ -319,27 +738,108 @@ class YoutubeAPI:
         if channel_result is None:
             self.__logger.warning("No channels available")
             return
-        else:
-            for channel in channel_result:
-                playlists = self.__get_channel_playlists(
-                    part='snippet',
-                    channelId=channel['_id'],
-                    maxResults=50
-                )
-                if playlists is False:
-                    return
-                for pl in playlists:
-                    self.__db.insert_playlist(pl)
-                    """
-                    self.__get_playlist_videos(
+
+        try:
+            if self.__channel_expansion == 'uploads':
+                with ThreadPoolExecutor(max_workers=self.__concurrency) as executor:
+                    self.__crawl_uploads(executor, [channel['_id'] for channel in channel_result], [])
+            else:
+                for channel in channel_result:
+                    playlists = self.__get_channel_playlists(
                         part='snippet',
-                        playlistId=pl['_id'],
+                        channelId=channel['_id'],
                         maxResults=50
                     )
-                    """
+                    if playlists is False:
+                        break
+        finally:
+            self.__db.flush()
 
     """ Users Network """
 
+    def stream_network(self, search_results):
+        """
+        Crawls the search results and yields the users network edges while the crawl is running. The edges of a
+        video are emitted as soon as its comments were crawled, so the network can be built before the slowest
+        video finished. The edge-list and the user names are also written to the network files, like
+        create_network does
+        :param search_results: the search results returned by search
+        :return: generator of (source, target, source name, target name) edges
+        """
+
+        edges = queue.Queue()
+        crawl_errors = []
+        video_channel = {}
+        channel_names = {}
+        user_names = {}
+
+        for item in search_results[0]['results']:
+            if item["id"]["kind"] == "youtube#video":
+                channel_id = item["snippet"]["channelId"]
+                video_channel[item["id"]["videoId"]] = channel_id
+                channel_names[channel_id] = item["snippet"].get("channelTitle", channel_id)
+
+        def emit_video_edges(video_id):
+            channel_id = video_channel[video_id]
+            for source, target, source_name, target_name in self.__get_video_edges(video_id, channel_id,
+                                                                                   channel_names[channel_id]):
+                edges.put((source, target, source_name, target_name))
+
+        def crawl():
+            try:
+                self.process_search_results(search_results, on_video_done=emit_video_edges)
+            except Exception as e:
+                crawl_errors.append(e)
+            finally:
+                edges.put(None)
+
+        crawler = threading.Thread(target=crawl, name="crawl-" + self.__file_name)
+        crawler.start()
+
+        # the edge-list is written from scratch, an earlier attempt of the same network may have left edges in it
+        with open(self.__path + self.__file_name + TEXT_EXTENSION, "w") as f:
+            edge = edges.get()
+            while edge is not None:
+                source, target, source_name, target_name = edge
+                f.write(source + " " + target + "\n")
+                user_names[source] = source_name
+                user_names[target] = target_name
+                yield edge
+                edge = edges.get()
+
+        crawler.join()
+        pickle.dump(user_names, open(self.__path + self.__file_name + OBJECT_EXTENSION, "wb"))
+
+        if crawl_errors:
+            raise crawl_errors[0]
+
+    def __get_video_edges(self, video_id, channel_id, channel_name):
+        """
+        Reads the stored comments of a video and creates the (channel, author) and (author, replier) edges
+        :param video_id: the id of the video
+        :param channel_id: the id of the channel that uploaded the video
+        :param channel_name: the title of the channel
+        :return: list of (source, target, source name, target name) edges
+        """
+
+        edges = []
+        comment_limit = {
+            "_id": 0,
+            'authorName': 1,
+            'authorId': 1,
+            'replies': 1
+        }
+
+        comments = self.__db.get_comments({'videoId': video_id}, comment_limit)
+        if comments:
+            for com in comments:
+                edges.append((channel_id, com["authorId"], channel_name, com["authorName"]))
+                if "replies" in com:
+                    for rep in com['replies']:
+                        edges.append((com["authorId"], rep["authorId"], com["authorName"], rep["authorName"]))
+
+        return edges
+
     def create_network(self, search_id):
         """
         Gets data from database and creates a file with the users edge-list
@@ -358,9 +858,8 @@ class YoutubeAPI:
         f = open(self.__path + self.__file_name + TEXT_EXTENSION, "a")
 
         # getting videos list from search
-        results = self.__db.get_search_results({'_id': search_id}, {'results': 1})
-        if results:
-            res = results.next()
+        res = self.__db.find_search_result(search_id, {'results': 1})
+        if res is not None:
             for vid in res['results']:
                 if vid["id"]["kind"] == "youtube#video":
                     videos_list.append(vid["id"]["videoId"])
@@ -371,13 +870,13 @@ class YoutubeAPI:
             return False
 
         # checking if channel id from videos exist and make a list with missing channels
+        channels = self.__db.find_channels(set(channels_list), {'title': 1})
         for channel in channels_list:
-            channel_result = self.__db.get_channel({'_id': channel}, {'title': 1})
-            if channel_result is None:
-                missing_channels.append(channel)
+            if channel not in channels:
+                if channel not in missing_channels:
+                    missing_channels.append(channel)
             else:
-                title = channel_result.next()["title"]
-                channel_names[channel] = title
+                channel_names[channel] = channels[channel]["title"]
 
         # get channels list
         if missing_channels:
@@ -387,14 +886,13 @@ class YoutubeAPI:
 
             if result_validation is True:
                 # checking if channel id from videos exist
-                for channel in channels_list:
-                    channel_result = self.__db.get_channel({'_id': channel}, {'title': 1})
-                    if channel_result is None:
+                channels = self.__db.find_channels(missing_channels, {'title': 1})
+                for channel in missing_channels:
+                    if channel not in channels:
                         self.__logger.warning("Channels is missing: " + channel)
                         return
                     else:
-                        title = channel_result.next()["title"]
-                        channel_names[channel] = title
+                        channel_names[channel] = channels[channel]["title"]
 
         # getting users from comments
         comment_limit = {
@@ -447,9 +945,9 @@ class YoutubeAPI:
         total_results = 0
 
         try:
-            results = self.__service.search().list(**kwargs).execute()
-        except HttpError as e:
-            self.__logger.error("HTTP error: " + str(e))
+            results = self.__execute('search', **kwargs)
+        except REQUEST_ERRORS as e:
+            self.__logger.error("Request error: " + str(e))
             return False, False, False
 
         if results:
@@ -463,7 +961,7 @@ class YoutubeAPI:
             if 'nextPageToken' in results:
                 kwargs['pageToken'] = results['nextPageToken']
                 try:
-                    results = self.__service.search().list(**kwargs).execute()
+                    results = self.__execute('search', **kwargs)
                     if 'nextPageToken' in results:
                         temp_token = {
                             '_id': results['nextPageToken'],
@@ -473,8 +971,8 @@ class YoutubeAPI:
                             'query': kwargs
                         }
                     index += 1
-                except HttpError as e:
-                    self.__logger.error("HTTP error: " + str(e))
+                except REQUEST_ERRORS as e:
+                    self.__logger.error("Request error: " + str(e))
                     return False, False, False
             else:
                 break
@@ -494,16 +992,16 @@ class YoutubeAPI:
         temp_token = {}
 
         try:
-            results = self.__service.channels().list(**kwargs).execute()
-        except HttpError as e:
-            self.__logger.error("HTTP error: " + str(e))
+            results = self.__execute('channels', **kwargs)
+        except REQUEST_ERRORS as e:
+            self.__logger.error("Request error: " + str(e))
             return False
         while results:
             for item in results['items']:
                 self.__db.insert_channel({
                     "_id": item['id'],
                     "title": item['snippet']['title'],
-                    "description": item['snippet']['description'],
+                    "description": item['snippet'].get('description', ""),
                     "publishedAt": item['snippet']['publishedAt'],
                     "retrieval date": datetime.utcnow(),
                     "statistics": {
@@ -516,10 +1014,12 @@ class YoutubeAPI:
                     }
                 })
 
+            self.__commit_etag(results)
+
             if 'nextPageToken' in results:
                 kwargs['pageToken'] = results['nextPageToken']
                 try:
-                    results = self.__service.channels().list(**kwargs).execute()
+                    results = self.__execute('channels', **kwargs)
                     if 'nextPageToken' in results:
                         temp_token = {
                             '_id': results['nextPageToken'],
@@ -527,8 +1027,8 @@ class YoutubeAPI:
                             "retrieval date": datetime.utcnow(),
                             'query': kwargs
                         }
-                except HttpError as e:
-                    self.__logger.error("HTTP error: " + str(e))
+                except REQUEST_ERRORS as e:
+                    self.__logger.error("Request error: " + str(e))
                     return False
             else:
                 break
@@ -548,27 +1048,21 @@ class YoutubeAPI:
         temp_token = {}
 
         try:
-            results = self.__service.channels().list(**kwargs).execute()
-        except HttpError as e:
-            self.__logger.error("HTTP error: " + str(e))
+            results = self.__execute('channels', **kwargs)
+        except REQUEST_ERRORS as e:
+            self.__logger.error("Request error: " + str(e))
             return False
         while results:
             for item in results['items']:
                 cid = item['id']
-                statistics = {
-                    'viewCount': item['statistics']['viewCount'] if 'viewCount' in item['statistics'] else 0,
-                    'subscriberCount': item['statistics']['subscriberCount'] if 'subscriberCount' in item[
-                        'statistics'] else 0,
-                    'videoCount': item['statistics']['videoCount'] if 'videoCount' in item['statistics'] else 0,
-                    'commentCount': item['statistics']['commentCount'] if 'commentCount' in item[
-                        'statistics'] else 0
-                }
-                self.__db.insert_video_statistics(cid, statistics)
+                self.__db.insert_video_statistics(cid, self.__parse_channel_statistics(item))
+
+            self.__commit_etag(results)
 
             if 'nextPageToken' in results:
                 kwargs['pageToken'] = results['nextPageToken']
                 try:
-                    results = self.__service.channels().list(**kwargs).execute()
+                    results = self.__execute('channels', **kwargs)
                     if 'nextPageToken' in results:
                         temp_token = {
                             '_id': results['nextPageToken'],
@@ -576,8 +1070,8 @@ class YoutubeAPI:
                             "retrieval date": datetime.utcnow(),
                             'query': kwargs
                         }
-                except HttpError as e:
-                    self.__logger.error("HTTP error: " + str(e))
+                except REQUEST_ERRORS as e:
+                    self.__logger.error("Request error: " + str(e))
                     return False
             else:
                 break
@@ -596,28 +1090,32 @@ class YoutubeAPI:
 
         final_results = []
         temp_token = {}
+        not_modified = False
 
         try:
-            results = self.__service.playlists().list(**kwargs).execute()
-        except HttpError as e:
-            self.__logger.error("HTTP error: " + str(e))
+            results = self.__execute('playlists', **kwargs)
+        except REQUEST_ERRORS as e:
+            self.__logger.error("Request error: " + str(e))
             return False
         while results:
+            not_modified = not_modified or results.get('notModified', False)
             for item in results['items']:
                 playlists = {
                     '_id': item['id'],
                     'channelId': kwargs["channelId"],
                     'title': item['snippet']['title'],
-                    'description': item['snippet']['description'],
+                    'description': item['snippet'].get('description', ""),
                     "publishedAt": item['snippet']['publishedAt'],
                     "retrieval date": datetime.utcnow(),
                 }
+                self.__db.insert_playlist(playlists)
                 final_results.append(playlists)
+            self.__commit_etag(results)
 
             if 'nextPageToken' in results:
                 kwargs['pageToken'] = results['nextPageToken']
                 try:
-                    results = self.__service.playlists().list(**kwargs).execute()
+                    results = self.__execute('playlists', **kwargs)
                     if 'nextPageToken' in results:
                         temp_token = {
                             '_id': results['nextPageToken'],
@@ -625,8 +1123,8 @@ class YoutubeAPI:
                             "retrieval date": datetime.utcnow(),
                             'query': kwargs
                         }
-                except HttpError as e:
-                    self.__logger.error("HTTP error: " + str(e))
+                except REQUEST_ERRORS as e:
+                    self.__logger.error("Request error: " + str(e))
                     return False
             else:
                 break
@@ -634,6 +1132,12 @@ class YoutubeAPI:
         if temp_token:
             self.__db.insert_token(temp_token)
 
+        # the items of a not modified page are not returned again, the playlists of the last crawl are used instead
+        if not_modified:
+            known = {playlist['_id'] for playlist in final_results}
+            final_results.extend(playlist for playlist in self.__db.get_channel_playlists(kwargs["channelId"])
+                                 if playlist['_id'] not in known)
+
         return final_results
 
     def __get_playlist_videos(self, **kwargs):
@@ -647,9 +1151,9 @@ class YoutubeAPI:
         temp_token = {}
 
         try:
-            results = self.__service.playlistItems().list(**kwargs).execute()
-        except HttpError as e:
-            self.__logger.error("HTTP error: " + str(e))
+            results = self.__execute('playlistItems', **kwargs)
+        except REQUEST_ERRORS as e:
+            self.__logger.error("Request error: " + str(e))
             return False
         while results:
             for item in results['items']:
@@ -657,16 +1161,18 @@ class YoutubeAPI:
                     '_id': item['snippet']['resourceId']['videoId'],
                     'channelId': item['snippet']['channelId'],
                     'title': item['snippet']['title'],
-                    'description': item['snippet']['description'],
+                    'description': item['snippet'].get('description', ""),
                     'publishedAt': item['snippet']['publishedAt'],
                     'statistics': [],
                 }
                 self.__db.insert_video(video)
 
+            self.__commit_etag(results)
+
             if 'nextPageToken' in results:
                 kwargs['pageToken'] = results['nextPageToken']
                 try:
-                    results = self.__service.playlistItems().list(**kwargs).execute()
+                    results = self.__execute('playlistItems', **kwargs)
                     if 'nextPageToken' in results:
                         temp_token = {
                             '_id': results['nextPageToken'],
@@ -674,8 +1180,8 @@ class YoutubeAPI:
                             "retrieval date": datetime.utcnow(),
                             'query': kwargs
                         }
-                except HttpError as e:
-                    self.__logger.error("HTTP error: " + str(e))
+                except REQUEST_ERRORS as e:
+                    self.__logger.error("Request error: " + str(e))
                     return False
             else:
                 break
@@ -685,6 +1191,63 @@ class YoutubeAPI:
 
         return final_results
 
+    @staticmethod
+    def __uploads_query(playlist_id, videos_limit=None):
+        """
+        Creates the arguments of the first playlist items request of an uploads playlist
+        :param playlist_id: the id of the uploads playlist
+        :param videos_limit: the maximum number of videos
+        :return: dictionary with the request arguments
+        """
+        page_size = 50 if videos_limit is None else max(1, min(50, videos_limit))
+        return {'part': 'snippet', 'playlistId': playlist_id, 'maxResults': page_size}
+
+    def __get_uploads_videos(self, playlist_id, videos_limit=None, first_page=None):
+        """
+        Gets the newest videos of an uploads playlist, without writing them. The pages are returned with the videos,
+        their etags are stored once the videos were written
+        :param playlist_id: the id of the uploads playlist
+        :param videos_limit: the maximum number of videos, all the videos are requested if it is not set
+        :param first_page: the first page if it was already requested in a batch
+        :return: tuple with the list of videos and the list of pages or False if the first page cannot be obtained
+        """
+
+        final_results = []
+        pages = []
+        kwargs = self.__uploads_query(playlist_id, videos_limit)
+        pages_limit = None
+        if videos_limit is not None:
+            pages_limit = math.ceil(videos_limit / kwargs['maxResults'])
+
+        nr_pages = 0
+        while pages_limit is None or nr_pages < pages_limit:
+            if nr_pages == 0 and first_page is not None:
+                results = first_page
+            else:
+                try:
+                    results = self.__execute('playlistItems', **kwargs)
+                except REQUEST_ERRORS as e:
+                    self.__logger.error("Request error: " + str(e))
+                    return (final_results[:videos_limit], pages) if nr_pages else False
+            nr_pages += 1
+            pages.append(results)
+
+            for item in results['items']:
+                final_results.append({
+                    '_id': item['snippet']['resourceId']['videoId'],
+                    'channelId': item['snippet']['channelId'],
+                    'title': item['snippet']['title'],
+                    'description': item['snippet'].get('description', ""),
+                    'publishedAt': item['snippet']['publishedAt'],
+                    'statistics': [],
+                })
+
+            if 'nextPageToken' not in results:
+                break
+            kwargs['pageToken'] = results['nextPageToken']
+
+        return final_results[:videos_limit], pages
+
     def __get_video_statistics(self, **kwargs):
         """
 
@@ -695,29 +1258,21 @@ class YoutubeAPI:
         temp_token = {}
 
         try:
-            results = self.__service.videos().list(**kwargs).execute()
-        except HttpError as e:
-            self.__logger.error("HTTP error: " + str(e))
+            results = self.__execute('videos', **kwargs)
+        except REQUEST_ERRORS as e:
+            self.__logger.error("Request error: " + str(e))
             return False
         while results:
             for item in results['items']:
                 vid = item['id']
-                statistics = {
-                    'viewCount': item['statistics']['viewCount'] if 'viewCount' in item['statistics'] else 0,
-                    'likeCount': item['statistics']['likeCount'] if 'likeCount' in item['statistics'] else 0,
-                    'dislikeCount': item['statistics']['dislikeCount'] if 'dislikeCount' in item[
-                        'statistics'] else 0,
-                    'favoriteCount': item['statistics']['favoriteCount'] if 'favoriteCount' in item[
-                        'statistics'] else 0,
-                    'commentCount': item['statistics']['commentCount'] if 'commentCount' in item[
-                        'statistics'] else 0
-                }
-                self.__db.insert_video_statistics(vid, statistics)
+                self.__db.insert_video_statistics(vid, self.__parse_video_statistics(item))
+
+            self.__commit_etag(results)
 
             if 'nextPageToken' in results:
                 kwargs['pageToken'] = results['nextPageToken']
                 try:
-                    results = self.__service.videos().list(**kwargs).execute()
+                    results = self.__execute('videos', **kwargs)
                     if 'nextPageToken' in results:
                         temp_token = {
                             '_id': results['nextPageToken'],
@@ -725,8 +1280,8 @@ class YoutubeAPI:
                             "retrieval date": datetime.utcnow(),
                             'query': kwargs
                         }
-                except HttpError as e:
-                    self.__logger.error("HTTP error: " + str(e))
+                except REQUEST_ERRORS as e:
+                    self.__logger.error("Request error: " + str(e))
                     return False
             else:
                 break
@@ -736,63 +1291,164 @@ class YoutubeAPI:
 
         return True
 
-    def __get_video_comments(self, **kwargs):
+    def __get_statistics(self, resource, ids):
+        """
+        Gets the statistics for a list of videos or channels. The ids are split in chunks of STATISTICS_CHUNK_SIZE,
+        the chunks are requested in parallel and the results are written with one bulk operation. The ids that are
+        missing from a not modified response are completed with their stored statistics
+        :param resource: the api resource - 'videos' or 'channels'
+        :param ids: the list of video or channel ids
+        :return: dictionary with the statistics of every id that was retrieved or is stored
         """
 
+        statistics = {}
+        if not ids:
+            return statistics
+
+        chunks = [ids[i:i + STATISTICS_CHUNK_SIZE] for i in range(0, len(ids), STATISTICS_CHUNK_SIZE)]
+        if self.__batch_size:
+            pages = self.__get_first_pages(resource, {
+                index: self.__statistics_query(chunk) for index, chunk in enumerate(chunks)
+            })
+            pages = list(pages.values())
+        else:
+            self.__load_etags(resource, [self.__statistics_query(chunk) for chunk in chunks])
+            with ThreadPoolExecutor(max_workers=min(self.__concurrency, len(chunks))) as executor:
+                pages = [results for results in executor.map(
+                    lambda chunk: self.__get_statistics_chunk(resource, chunk), chunks) if results is not False]
+
+        parse = self.__parse_video_statistics if resource == 'videos' else self.__parse_channel_statistics
+        for results in pages:
+            statistics.update({item['id']: parse(item) for item in results['items']})
+
+        if resource == 'videos':
+            self.__db.insert_video_statistics_many(statistics)
+        else:
+            self.__db.insert_channel_statistics_many(statistics)
+        for results in pages:
+            self.__commit_etag(results)
+
+        missing = [resource_id for resource_id in ids if resource_id not in statistics]
+        if missing:
+            if resource == 'videos':
+                statistics.update(self.__db.get_video_statistics(missing))
+            else:
+                statistics.update(self.__db.get_channel_statistics(missing))
+
+        return statistics
+
+    def __get_statistics_chunk(self, resource, ids):
+        """
+        Gets the statistics page of at most STATISTICS_CHUNK_SIZE videos or channels with one request
+        :param resource: the api resource - 'videos' or 'channels'
+        :param ids: the list of video or channel ids
+        :return: the response dictionary or False if the request failed
+        """
+
+        try:
+            return self.__execute(resource, **self.__statistics_query(ids))
+        except REQUEST_ERRORS as e:
+            self.__logger.error("Request error: " + str(e))
+            return False
+
+    @staticmethod
+    def __statistics_query(ids):
+        """
+        Creates the arguments of a statistics request
+        :param ids: the list of at most STATISTICS_CHUNK_SIZE video or channel ids
+        :return: dictionary with the request arguments
+        """
+        return {'part': 'statistics', 'id': ','.join(ids), 'maxResults': STATISTICS_CHUNK_SIZE}
+
+    @staticmethod
+    def __parse_channel_statistics(item):
+        """
+        Extracts the statistics of a channel resource
+        :param item: the channel resource
+        :return: the channel statistics
+        """
+        return {
+            'viewCount': item['statistics']['viewCount'] if 'viewCount' in item['statistics'] else 0,
+            'subscriberCount': item['statistics']['subscriberCount'] if 'subscriberCount' in item[
+                'statistics'] else 0,
+            'videoCount': item['statistics']['videoCount'] if 'videoCount' in item['statistics'] else 0,
+            'commentCount': item['statistics']['commentCount'] if 'commentCount' in item[
+                'statistics'] else 0
+        }
+
+    @staticmethod
+    def __parse_video_statistics(item):
+        """
+        Extracts the statistics of a video resource
+        :param item: the video resource
+        :return: the video statistics
+        """
+        return {
+            'viewCount': item['statistics']['viewCount'] if 'viewCount' in item['statistics'] else 0,
+            'likeCount': item['statistics']['likeCount'] if 'likeCount' in item['statistics'] else 0,
+            'dislikeCount': item['statistics']['dislikeCount'] if 'dislikeCount' in item[
+                'statistics'] else 0,
+            'favoriteCount': item['statistics']['favoriteCount'] if 'favoriteCount' in item[
+                'statistics'] else 0,
+            'commentCount': item['statistics']['commentCount'] if 'commentCount' in item[
+                'statistics'] else 0
+        }
+
+    @staticmethod
+    def __video_comments_query(video_id):
+        """
+        Creates the arguments of the first comment threads request of a video
+        :param video_id: the id of the video
+        :return: dictionary with the request arguments
+        """
+        return {'part': 'snippet,replies', 'videoId': video_id, 'textFormat': 'plainText', 'maxResults': 100,
+                'order': 'relevance'}
+
+    def __get_video_comments(self, pages_limit=None, first_page=None, **kwargs):
+        """
+
+        :param pages_limit: the maximum number of pages, comment_pages_limit if it is not set
+        :param first_page: the first page if it was already requested in a batch
         :param kwargs:
         :return:
         """
 
         final_results = []
         temp_token = {}
-        nr_pages = self.__comment_pages_limit
+        nr_pages = self.__comment_pages_limit if pages_limit is None else pages_limit
         index = 0
 
-        try:
-            results = self.__service.commentThreads().list(**kwargs).execute()
-        except HttpError as e:
-            self.__logger.error("HTTP error: " + str(e))
-            return False
+        if nr_pages <= 0:
+            return final_results
+
+        if first_page is not None:
+            results = first_page
+        else:
+            try:
+                results = self.__execute('commentThreads', **kwargs)
+            except REQUEST_ERRORS as e:
+                self.__logger.error("Request error: " + str(e))
+                return False
         while results and index < nr_pages:
             for item in results['items']:
-                cid = item['id']
-                self.__db.insert_comment({
-                    '_id': item['id'],
-                    'videoId': item['snippet']['topLevelComment']['snippet']['videoId'],
-                    'authorName': item['snippet']['topLevelComment']['snippet']['authorDisplayName'],
-                    'authorId': item['snippet']['topLevelComment']['snippet']['authorChannelId']['value']
-                    if 'authorChannelId' in item['snippet']['topLevelComment']['snippet'] else "",
-                    'text': item['snippet']['topLevelComment']['snippet']['textDisplay'],
-                    'likeCount': item['snippet']['topLevelComment']['snippet']['likeCount'],
-                    'publishedAt': item['snippet']['topLevelComment']['snippet']['publishedAt'],
-                    'replies': []
-                })
-                if 'replies' in item:
-                    for r_item in item['replies']['comments']:
-                        self.__db.insert_comment_reply(cid, {
-                            '_id': r_item['id'],
-                            'videoId': r_item['snippet']['videoId'],
-                            'authorName': r_item['snippet']['authorDisplayName'],
-                            'authorId': r_item['snippet']['authorChannelId']['value']
-                            if 'authorChannelId' in r_item['snippet'] else "",
-                            'text': r_item['snippet']['textDisplay'],
-                            'likeCount': r_item['snippet']['likeCount'],
-                            'publishedAt': r_item['snippet']['publishedAt']
-                        })
+                self.__store_comment_thread(item)
+            self.__commit_etag(results)
+            index += 1
             if 'nextPageToken' in results:
                 kwargs['pageToken'] = results['nextPageToken']
+                if index == nr_pages:
+                    # the remaining pages are crawled later from the tokens backlog
+                    temp_token = {
+                        '_id': results['nextPageToken'],
+                        'type': 'video_comments',
+                        "retrieval date": datetime.utcnow(),
+                        'query': kwargs
+                    }
+                    break
                 try:
-                    results = self.__service.commentThreads().list(**kwargs).execute()
-                    if 'nextPageToken' in results:
-                        temp_token = {
-                            '_id': results['nextPageToken'],
-                            'type': 'video_comments',
-                            "retrieval date": datetime.utcnow(),
-                            'query': kwargs
-                        }
-                    index += 1
-                except HttpError as e:
-                    self.__logger.error("HTTP error: " + str(e))
+                    results = self.__execute('commentThreads', **kwargs)
+                except REQUEST_ERRORS as e:
+                    self.__logger.error("Request error: " + str(e))
                     return False
             else:
                 break
@@ -802,38 +1458,406 @@ class YoutubeAPI:
 
         return final_results
 
-    """ Authentication"""
+    def __get_new_video_comments(self, video_id, pages_limit=None):
+        """
+        Gets only the comments that were published after the last crawl of the video. The comment threads are
+        requested from the newest and the paging stops at the first thread that is older than the watermark of the
+        video. New replies to old threads are not retrieved in this mode
+        :param video_id: the id of the video
+        :param pages_limit: the maximum number of pages, comment_pages_limit if it is not set
+        :return: the number of new comment threads or False if the comments cannot be obtained
+        """
+
+        nr_pages = self.__comment_pages_limit if pages_limit is None else pages_limit
+
+        kwargs = {
+            'part': 'snippet,replies',
+            'videoId': video_id,
+            'textFormat': 'plainText',
+            'maxResults': 100,
+            'order': 'time'
+        }
+        watermark = self.__db.get_comment_watermark(video_id)
+        known = watermark['newest'] if watermark else ""
+        newest = known
+        nr_new = 0
+        index = 0
+
+        while index < nr_pages:
+            try:
+                results = self.__execute('commentThreads', **kwargs)
+            except REQUEST_ERRORS as e:
+                self.__logger.error("Request error: " + str(e))
+                return False
+            index += 1
+            if results.get('notModified'):
+                break
+
+            reached_known = False
+            for item in results['items']:
+                published_at = item['snippet']['topLevelComment']['snippet']['publishedAt']
+                if known and published_at <= known:
+                    reached_known = True
+                    break
+                self.__store_comment_thread(item)
+                newest = max(newest, published_at)
+                nr_new += 1
+            self.__commit_etag(results)
+
+            if reached_known or 'nextPageToken' not in results:
+                break
+            kwargs['pageToken'] = results['nextPageToken']
+            if index == nr_pages:
+                self.__db.insert_token({
+                    '_id': results['nextPageToken'],
+                    'type': 'video_comments',
+                    "retrieval date": datetime.utcnow(),
+                    'query': kwargs
+                })
+
+        self.__db.set_comment_watermark(video_id, newest)
+        self.__logger.info("New comment threads for video [" + video_id + "]: " + str(nr_new))
+
+        return nr_new
 
-    def __get_authentication_service(self):
+    def __store_comment_thread(self, item):
+        """
+        Writes a comment thread and its replies in the database
+        :param item: the comment thread resource
         """
 
-        :return:
+        cid = item['id']
+        self.__db.insert_comment({
+            '_id': item['id'],
+            'videoId': item['snippet']['topLevelComment']['snippet']['videoId'],
+            'authorName': item['snippet']['topLevelComment']['snippet']['authorDisplayName'],
+            'authorId': item['snippet']['topLevelComment']['snippet']['authorChannelId']['value']
+            if 'authorChannelId' in item['snippet']['topLevelComment']['snippet'] else "",
+            'text': item['snippet']['topLevelComment']['snippet'].get('textDisplay', ""),
+            'likeCount': item['snippet']['topLevelComment']['snippet']['likeCount'],
+            'publishedAt': item['snippet']['topLevelComment']['snippet']['publishedAt'],
+            'replies': []
+        })
+        if 'replies' in item:
+            for r_item in item['replies']['comments']:
+                self.__db.insert_comment_reply(cid, {
+                    '_id': r_item['id'],
+                    'videoId': r_item['snippet']['videoId'],
+                    'authorName': r_item['snippet']['authorDisplayName'],
+                    'authorId': r_item['snippet']['authorChannelId']['value']
+                    if 'authorChannelId' in r_item['snippet'] else "",
+                    'text': r_item['snippet'].get('textDisplay', ""),
+                    'likeCount': r_item['snippet']['likeCount'],
+                    'publishedAt': r_item['snippet']['publishedAt']
+                })
+
+    """ Requests """
+
+    def __execute(self, endpoint, **kwargs):
+        """
+        Sends a list request, the identical requests that are in flight at the same time share one round trip
+        :param endpoint: the name of the api resource
+        :param kwargs: the arguments of the list request
+        :return: the response dictionary
         """
 
-        http = httplib2.Http(cache=".cache")
-        self.__service = build(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION, http=http, developerKey=DEVELOPER_KEY,
-                               cache_discovery=True)
+        self.__check_stopped()
+        if 'fields' not in kwargs:
+            kwargs['fields'] = self.__field_masks[endpoint]
+        return flights.do(self.__request_key(endpoint, kwargs), self.__send, endpoint, kwargs)
 
-    """ Search results cache """
+    @staticmethod
+    def __create_field_masks(include_text):
+        """
+        Creates the partial response masks of the endpoints
+        :param include_text: keep the descriptions and the comment texts in the responses
+        :return: dictionary with the fields mask of every endpoint
+        """
 
-    def __check_search_cache(self, query):
+        comment = COMMENT_FIELDS.format(text='textDisplay,' if include_text else '')
+        description = 'description,' if include_text else ''
+        return {
+            endpoint: mask.format(description=description, comment=comment)
+            for endpoint, mask in FIELD_MASKS.items()
+        }
+
+    def __send(self, endpoint, kwargs):
+        """
+        Sends a list request, the transient failures are retried by the retry policy
+        :param endpoint: the name of the api resource
+        :param kwargs: the arguments of the list request
+        :return: the response dictionary
         """
 
-        :param query:
-        :return:
+        if endpoint not in CONDITIONAL_ENDPOINTS:
+            return self.__retry_policy.call(self.__execute_request, endpoint, kwargs)
+
+        request_key = self.__request_key(endpoint, kwargs)
+        cached = self.__get_etag(request_key)
+        etag = cached['etag'] if cached else None
+
+        try:
+            results = self.__retry_policy.call(self.__execute_request, endpoint, kwargs, etag)
+        except HttpError as e:
+            if cached and e.resp.status == 304:
+                return self.__not_modified_page(cached)
+            raise
+
+        return self.__store_etag(endpoint, request_key, cached, results)
+
+    def __load_etags(self, endpoint, queries):
+        """
+        Reads the stored etags of the first requests of a crawl step with one query, so the requests do not read
+        them one by one
+        :param endpoint: the name of the api resource
+        :param queries: the list with the arguments of every request
         """
 
-        results = self.__db.get_search_results(query)
-        if results:
-            self.__logger.info("Getting cached search with keyword: " + query['keyword'])
-            return results.next()
+        if endpoint not in CONDITIONAL_ENDPOINTS or not queries:
+            return
+        request_keys = [
+            self.__request_key(endpoint, dict(kwargs, fields=kwargs.get('fields', self.__field_masks[endpoint])))
+            for kwargs in queries
+        ]
+        etags = self.__db.get_etags(request_keys)
+        with self.__etags_lock:
+            for key in request_keys:
+                self.__etags[key] = etags.get(key)
+
+    def __get_etag(self, request_key):
+        """
+        Returns the stored etag of a request, from the etags loaded in bulk or from the database
+        :param request_key: the key of the request
+        :return: the etag document or None
+        """
+
+        with self.__etags_lock:
+            if request_key in self.__etags:
+                return self.__etags.pop(request_key)
+        return self.__db.get_etag(request_key)
+
+    def __store_etag(self, endpoint, request_key, cached, results):
+        """
+        Attaches the etag of a response page to the page, it is stored by __commit_etag once the items of the page
+        were written. A page with the known etag is replaced by an empty not modified page
+        :param endpoint: the name of the api resource
+        :param request_key: the key of the request
+        :param cached: the stored etag document of the request or None
+        :param results: the response dictionary
+        :return: the response dictionary
+        """
+
+        # the http cache answers a 304 with the cached page, which has the same etag
+        if cached and results.get('etag') == cached['etag']:
+            return self.__not_modified_page(cached)
+
+        if 'etag' in results:
+            results[PENDING_ETAG] = (request_key, {
+                'endpoint': endpoint,
+                'etag': results['etag'],
+                'nextPageToken': results.get('nextPageToken'),
+                "retrieval date": datetime.utcnow()
+            }, self.__db.get_write_errors())
+        return results
+
+    def __commit_etag(self, results):
+        """
+        Stores the etag of a page after its items were handed to the database. A buffered etag is written after
+        the items and dropped if a write failed since the page arrived, so a page whose items were lost is
+        requested again by the next crawl
+        :param results: the response dictionary
+        """
+        pending = results.pop(PENDING_ETAG, None)
+        if pending is not None:
+            self.__db.insert_etag(*pending)
+
+    def __get_first_pages(self, endpoint, queries):
+        """
+        Requests independent list requests in http batches of batch_size requests, the batches are sent in
+        parallel. A request that failed is not in the result, its resource is crawled with single requests
+        :param endpoint: the name of the api resource
+        :param queries: dictionary with the id of every resource and the arguments of its request
+        :return: dictionary with the response of every resource whose request succeeded
+        """
+
+        ids = list(queries)
+        chunks = [ids[i:i + self.__batch_size] for i in range(0, len(ids), self.__batch_size)]
+        pages = {}
+        if not chunks:
+            return pages
+
+        with ThreadPoolExecutor(max_workers=min(self.__concurrency, len(chunks))) as executor:
+            batches = executor.map(lambda chunk: self.__send_batch(endpoint, [queries[i] for i in chunk]), chunks)
+            for chunk, responses in zip(chunks, batches):
+                for resource_id, response in zip(chunk, responses):
+                    if isinstance(response, Exception):
+                        self.__logger.error("Request error: " + str(response))
+                    else:
+                        pages[resource_id] = response
+
+        self.__logger.info("Batched " + str(len(ids)) + " " + endpoint + " requests in " + str(len(chunks)) +
+                           " round trips")
+        return pages
+
+    def __send_batch(self, endpoint, queries):
+        """
+        Sends list requests of an endpoint in one http batch. The requests that are already in flight, in a batch or
+        alone, are not sent again and share the running response
+        :param endpoint: the name of the api resource
+        :param queries: the list with the arguments of every request
+        :return: list with the response dictionary or the exception of every request
+        """
+
+        self.__check_stopped()
+        queries = [dict(kwargs, fields=kwargs.get('fields', self.__field_masks[endpoint])) for kwargs in queries]
+        request_keys = [self.__request_key(endpoint, kwargs) for kwargs in queries]
+        queries = dict(zip(request_keys, queries))
+        responses = flights.do_many(request_keys, lambda keys: dict(zip(
+            keys, self.__send_batch_requests(endpoint, keys, [queries[key] for key in keys]))))
+        return [responses[key] for key in request_keys]
+
+    def __send_batch_requests(self, endpoint, request_keys, queries):
+        """
+        Sends list requests of an endpoint in one http batch. The requests that fail with a transient or a quota
+        error are sent again one by one, with the retry policy and the key rotation
+        :param endpoint: the name of the api resource
+        :param request_keys: the list with the key of every request
+        :param queries: the list with the arguments of every request
+        :return: list with the response dictionary or the exception of every request
+        """
+
+        etags = self.__db.get_etags(request_keys) if endpoint in CONDITIONAL_ENDPOINTS else {}
+        cached = [etags.get(key) for key in request_keys]
+        responses = [None] * len(queries)
+        exceptions = [None] * len(queries)
+
+        def callback(request_id, response, exception):
+            responses[int(request_id)] = response
+            exceptions[int(request_id)] = exception
+
+        try:
+            with self.__key_pool.lease(endpoint, len(queries)) as key:
+                with self.__client(key) as service:
+                    batch = service.new_batch_http_request(callback=callback)
+                    for index, kwargs in enumerate(queries):
+                        request = getattr(service, endpoint)().list(**kwargs)
+                        if cached[index]:
+                            request.headers['If-None-Match'] = cached[index]['etag']
+                        batch.add(request, request_id=str(index))
+                    self.__retry_policy.call(batch.execute)
+        except REQUEST_ERRORS as e:
+            self.__logger.warning("Batch request failed, sending the requests one by one: " + str(e))
+            exceptions = [e] * len(queries)
+
+        results = []
+        for index, kwargs in enumerate(queries):
+            exception = exceptions[index]
+            if exception is None:
+                results.append(self.__store_etag(endpoint, request_keys[index], cached[index], responses[index]))
+            elif isinstance(exception, HttpError) and cached[index] and exception.resp.status == 304:
+                results.append(self.__not_modified_page(cached[index]))
+            elif classify_error(exception) == FATAL:
+                results.append(exception)
+            else:
+                # the request is already in flight under its key, so it is sent without __execute
+                self.__check_stopped()
+                try:
+                    results.append(self.__send(endpoint, kwargs))
+                except REQUEST_ERRORS as e:
+                    results.append(e)
+
+        return results
+
+    def __execute_request(self, endpoint, kwargs, etag=None):
+        """
+        Executes one attempt of a request with a key of the pool. When the api answers that the quota of the key
+        is exceeded the key is skipped and the request is sent again with the next key
+        :param endpoint: the name of the api resource
+        :param kwargs: the arguments of the list request
+        :param etag: the etag sent in the If-None-Match header
+        :return: the response dictionary
+        """
+
+        while True:
+            with self.__key_pool.lease(endpoint) as key:
+                with self.__client(key) as service:
+                    request = getattr(service, endpoint)().list(**kwargs)
+                    if etag:
+                        request.headers['If-None-Match'] = etag
+                    try:
+                        return request.execute()
+                    except HttpError as e:
+                        if classify_error(e) != QUOTA:
+                            raise
+                        self.__key_pool.mark_exhausted(key)
+
+    @staticmethod
+    def __not_modified_page(cached):
+        """
+        Creates an empty page for a response that did not change since the last crawl, so its items are neither
+        parsed nor written again. The stored page token is kept for continuing the pagination
+        :param cached: the etag document of the request
+        :return: the response dictionary
+        """
+
+        page = {'etag': cached['etag'], 'items': [], 'notModified': True}
+        if cached.get('nextPageToken'):
+            page['nextPageToken'] = cached['nextPageToken']
+        return page
+
+    @staticmethod
+    def __request_key(endpoint, kwargs):
+        """
+        Creates a key that identifies a request by its endpoint and arguments
+        :param endpoint: the name of the api resource
+        :param kwargs: the arguments of the list request
+        :return: the key of the request
+        """
+
+        return hashlib.sha1(json.dumps([endpoint, kwargs], sort_keys=True, default=str).encode()).hexdigest()
+
+    """ Authentication"""
+
+    @contextmanager
+    def __client(self, developer_key):
+        """
+        Returns the api service for one request, a pooled client of the key if no service was set
+        :param developer_key: the api key of the request
+        :return: context manager with the api service
+        """
+
+        if self.__service is not None:
+            yield self.__service
         else:
-            return []
+            with get_service_factory(developer_key).client() as service:
+                yield service
+
+    """ Search results cache """
 
-    def __write_search_cache(self, search_results):
+    def __check_search_cache(self, cache_key, nr_results):
+        """
+        Looks up a search in the search cache
+        :param cache_key: the canonical key of the search or None if the search is not cached
+        :param nr_results: the number of requested results
+        :return: list with the cached search result or an empty list
         """
 
-        :param search_results:
+        if cache_key is None:
+            return []
+
+        result = self.__search_cache.get(self.__db, cache_key, nr_results)
+        self.__logger.info("Search cache " + ("hit" if result else "miss") + ": " + cache_key + " " +
+                           str(self.__search_cache.get_counters()))
+        return [result] if result else []
+
+    def __write_search_cache(self, cache_key, search_results):
+        """
+        Stores a search in the search cache, the searches continued from a page token are only stored
+        :param cache_key: the canonical key of the search or None if the search is not cached
+        :param search_results: list with the search result
         :return:
         """
-        self.__db.insert_search_results(search_results)
+        if cache_key is None:
+            self.__db.insert_search_results(search_results)
+        else:
+            self.__search_cache.put(self.__db, cache_key, search_results[0])
@@ -0,0 +1,132 @@
+import argparse
+import sys
+import threading
+import time
+
+from application.fake_service import RecordingService, ReplayService, SyntheticYoutubeService
+from application.key_pool import KeyPool, load_keys
+from application.web_crawler import YoutubeAPI
+from application.api_service import get_service_factory
+from application.database import MongoDB
+from utilities.utils import create_file_name, NETWORKS_FOLDER, COMMENT_PAGES_LIMIT, CRAWLER_CONCURRENCY
+
+# measures the crawl throughput of YoutubeAPI against recorded or synthetic responses
+#   python benchmark.py --record .recordings --keyword "python tutorial"     (uses the api quota)
+#   python benchmark.py --replay .recordings --keyword "python tutorial" --latency 0.2
+#   python benchmark.py --videos 200 --comments 2000 --concurrency 16 --latency 0.1 --error-rate 0.01
+#   python benchmark.py --videos 20 --write-batch-size 500 --crawlers 4 --latency 0.05
+
+
+def create_service(args):
+    """
+    Creates the service that answers the crawler requests
+    :param args: the command line arguments
+    :return: the service
+    """
+    if args.record:
+        keys = load_keys()
+        if not keys:
+            raise SystemExit("Recording needs an api key, set GOOGLE_DEV_KEY or GOOGLE_DEV_KEYS in the environment")
+        return RecordingService(get_service_factory(keys[0]), args.record)
+    if args.replay:
+        return ReplayService(args.replay, latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    return SyntheticYoutubeService(nr_videos=args.videos, comments_per_video=args.comments,
+                                   replies_per_comment=args.replies, nr_users=args.users, latency=args.latency,
+                                   error_rate=args.error_rate, seed=args.seed)
+
+
+def check_concurrent_crawls(args, service, key_pool, search_results):
+    """
+    Streams the network of the same search with several crawlers at the same time. The crawlers coalesce their
+    identical calls, so most of them read comments written by another crawler, every network must still be complete.
+    The stored comments and etags of the search are removed first, otherwise the earlier crawl would hide missing
+    writes
+    :param args: the command line arguments
+    :param service: the service that answers the crawler requests
+    :param key_pool: the api keys of the crawlers
+    :param search_results: the search results crawled by every crawler
+    :return: True if all the networks have the same edges
+    """
+    video_ids = [item['id']['videoId'] for item in search_results[0]['results']
+                 if item['id']['kind'] == 'youtube#video']
+    db = MongoDB()
+    db.delete_video_comments(video_ids)
+    db.delete_etags()
+
+    networks = [None] * args.crawlers
+
+    def stream(index):
+        crawler = YoutubeAPI(create_file_name() + "_" + str(index), NETWORKS_FOLDER, args.comment_pages,
+                             args.concurrency, service=service, key_pool=key_pool, batch_size=args.batch_size,
+                             write_batch_size=args.write_batch_size)
+        networks[index] = sorted((source, target) for source, target, _, _ in crawler.stream_network(search_results))
+
+    threads = [threading.Thread(target=stream, args=(index,)) for index in range(args.crawlers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print("Concurrent:    " + str(args.crawlers) + " crawlers, " +
+          ", ".join(str(len(network)) if network is not None else "failed" for network in networks) + " edges")
+    return all(network is not None and network == networks[0] for network in networks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline crawl benchmark")
+    parser.add_argument('--record', help="directory where the api responses are recorded")
+    parser.add_argument('--replay', help="directory with the recorded responses")
+    parser.add_argument('--keyword', default='synthetic')
+    parser.add_argument('--videos', type=int, default=50)
+    parser.add_argument('--comments', type=int, default=500, help="comment threads of every synthetic video")
+    parser.add_argument('--replies', type=int, default=2, help="replies of every synthetic comment thread")
+    parser.add_argument('--users', type=int, default=10000, help="number of synthetic users")
+    parser.add_argument('--comment-pages', type=int, default=COMMENT_PAGES_LIMIT)
+    parser.add_argument('--concurrency', type=int, default=CRAWLER_CONCURRENCY)
+    parser.add_argument('--batch-size', type=int, default=0, help="first page requests in an http batch")
+    parser.add_argument('--write-batch-size', type=int, default=0, help="database writes in a bulk write")
+    parser.add_argument('--latency', type=float, default=0.0, help="mean seconds added to every request")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="probability of a 500 error")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--crawlers', type=int, default=1,
+                        help="crawlers that stream the network of the search at the same time, their networks must "
+                             "be equal")
+    parser.add_argument('--keep-etags', action='store_true',
+                        help="keep the etags of earlier runs, the unchanged pages are answered as not modified")
+    args = parser.parse_args()
+
+    # the etags of an earlier run would turn the requests of this one into not modified answers
+    if not args.keep_etags:
+        MongoDB().delete_etags()
+
+    service = create_service(args)
+    key_pool = KeyPool(load_keys() or ['offline'], capacity=10 ** 9, concurrency=args.concurrency)
+    file_name = create_file_name()
+    crawler = YoutubeAPI(file_name, NETWORKS_FOLDER, args.comment_pages, args.concurrency, service=service,
+                         key_pool=key_pool, batch_size=args.batch_size,
+                         write_batch_size=args.write_batch_size)
+
+    start = time.time()
+    results = crawler.search(args.keyword, args.videos)
+    crawler.process_search_results(results)
+    crawl_time = time.time() - start
+
+    start = time.time()
+    crawler.create_network(results[0]['_id'])
+    network_time = time.time() - start
+
+    nr_requests = len(service.calls)
+    print("Requests:      " + str(nr_requests))
+    print("Round trips:   " + str(service.round_trips))
+    print("Quota units:   " + str(key_pool.get_counters()['spent']))
+    print("Crawl time:    %.2f s (%.1f requests/s)" % (crawl_time, nr_requests / crawl_time if crawl_time else 0))
+    print("Network time:  %.2f s" % network_time)
+    print("Network file:  " + NETWORKS_FOLDER + file_name)
+
+    if args.crawlers > 1 and not check_concurrent_crawls(args, service, key_pool, results):
+        print("The concurrent crawlers created different networks")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+import sys
+
+from application.database import MongoDB
+
+# builds the indexes of the MongoDB collections and checks that the crawler queries use them
+#   python create_indexes.py
+
+db = MongoDB()
+
+# create the indexes, the existing ones are kept
+print(db.ensure_indexes())
+
+# show the queries that scan the whole collection or sort their results in memory
+plans = db.explain_queries()
+for query, indexed in plans.items():
+    print(("OK    " if indexed else "SCAN  ") + query)
+
+if not all(plans.values()):
+    sys.exit(1)
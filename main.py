@@ -3,7 +3,9 @@ import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output, State
 from flask_login import current_user
+from pymongo import errors
 
+from application.database import MongoDB
 from application.message_logger import MessageLogger
 from pages import (
     home,
@@ -201,6 +203,13 @@ def user_logout(user_input):
         return 'Login', '/login', None
 
 
+# the indexes are built when the module is loaded, also when the server is started by a wsgi server (main:server)
+try:
+    MongoDB().ensure_indexes()
+except errors.ConnectionFailure:
+    app.logger.warning("Indexes cannot be built, the MongoDB database is not available")
+
+
 if __name__ == '__main__':
     ml = MessageLogger('werkzeug')
     handler = ml.get_handler()
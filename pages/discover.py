@@ -1,3 +1,5 @@
+import threading
+
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
@@ -5,6 +7,8 @@ from dash.dependencies import Output, Input, State
 from flask_login import current_user
 from pymongo import errors
 
+from application.crawl_planner import downscale_search
+from application.crawl_worker import enqueue_crawl_job
 from application.message_logger import MessageLogger
 from application.network_analysis import NetworkAnalysis
 from application.web_crawler import YoutubeAPI
@@ -12,7 +16,9 @@ from server import app, engine
 from utilities.auth import layout_auth, send_finished_process_confirmation, add_user_search, update_search_status, \
     delete_user_network
 from utilities.utils import create_data_table_network, processing_algorithms, graph_types, create_file_name, \
-    NETWORKS_FOLDER, COMMENT_PAGES_LIMIT, NR_VIDEOS_LIMIT
+    NETWORKS_FOLDER, COMMENT_PAGES_LIMIT, NR_VIDEOS_LIMIT, CRAWLER_CONCURRENCY, INCREMENTAL_COMMENTS, \
+    INCLUDE_TEXT, ADAPTIVE_COMMENT_PAGES, CHANNEL_EXPANSION, CHANNEL_VIDEOS_LIMIT, REQUEST_BATCH_SIZE, \
+    WRITE_BATCH_SIZE, SKIP_UNCHANGED_WRITES, SEARCH_QUOTA_SHARE, DISTRIBUTED_CRAWL
 
 success_alert = dbc.Alert(
     'Finished searching',
@@ -38,6 +44,18 @@ quota_exceeded_alert = dbc.Alert(
     dismissable=True
 )
 
+queued_alert = dbc.Alert(
+    'Search queued. The results will be shown in the dashboard when they are ready.',
+    color='info',
+    dismissable=True
+)
+
+oversized_alert = dbc.Alert(
+    'The search needs more quota than is left for today. Try the next day.',
+    color='danger',
+    dismissable=True
+)
+
 login_alert = dbc.Alert(
     'User not logged in. Taking you to login.',
     color='danger'
@@ -52,6 +70,45 @@ def graph_alert(graph):
     )
 
 
+def downscaled_alert(nr_videos):
+    return dbc.Alert(
+        'The search was reduced to ' + str(nr_videos) + ' videos to fit the remaining quota',
+        color='warning',
+        dismissable=True
+    )
+
+
+def create_crawler(file_name=None):
+    """
+    Creates the crawler of a search with the crawl settings of the application
+    :param file_name: the name of the network files
+    :return: the crawler
+    """
+    return YoutubeAPI(file_name, NETWORKS_FOLDER, COMMENT_PAGES_LIMIT, CRAWLER_CONCURRENCY,
+                      incremental_comments=INCREMENTAL_COMMENTS, include_text=INCLUDE_TEXT,
+                      adaptive_comments=ADAPTIVE_COMMENT_PAGES,
+                      channel_expansion=CHANNEL_EXPANSION, channel_videos_limit=CHANNEL_VIDEOS_LIMIT,
+                      batch_size=REQUEST_BATCH_SIZE, write_batch_size=WRITE_BATCH_SIZE,
+                      skip_unchanged=SKIP_UNCHANGED_WRITES)
+
+
+# crawler of the process that estimates the searches while the user types, it does not crawl
+__planner = None
+__planner_lock = threading.Lock()
+
+
+def get_planner():
+    """
+    Returns the crawler that plans the searches, it is created the first time it is needed
+    :return: the crawler
+    """
+    global __planner
+    with __planner_lock:
+        if __planner is None:
+            __planner = create_crawler()
+        return __planner
+
+
 location = dcc.Location(id='discover-url', refresh=True, pathname='/discover')
 ml = MessageLogger('discover')
 logger = ml.get_logger()
@@ -101,6 +158,7 @@ def layout():
                 dcc.Input(id='nr_videos', value='1', type='range', placeholder="Valid from 1 to " + str(NR_VIDEOS_LIMIT), min=1,
                           max=NR_VIDEOS_LIMIT,
                           step=1),
+                html.Div(id='estimate-div', className="small text-muted"),
                 html.Br(),
                 html.H5("Number of influencers found:"), html.Div(id="range-val-users"),
                 dcc.Input(id='nr_users', value='30', type='range', placeholder="Valid from 1 to 100", min=1,
@@ -191,6 +249,25 @@ def input_triggers_spinner(value):
     return value
 
 
+@app.callback(Output('estimate-div', 'children'),
+              [Input('keyword', 'value'),
+               Input('nr_videos', 'value')])
+def update_estimate(keyword, nr_videos):
+    if not keyword or not nr_videos:
+        return ''
+
+    try:
+        plan = get_planner().plan_search(keyword, int(nr_videos))
+    except errors.ConnectionFailure:
+        return ''
+
+    # the quota counters of the api keys are kept by every server process, the other processes are not included
+    return "Estimated cost: " + str(plan['quota']) + " of the " + str(plan['remaining']) + \
+           " quota units left to this server process, " + \
+           str(plan['requests']) + " requests, about " + str(plan['edges']) + " connections and " + \
+           str(round(plan['seconds'])) + " seconds" + (" (cached search)" if plan['search cached'] else "")
+
+
 @app.callback(Output("range-val-users", "children"),
               [Input('nr_users', 'value')])
 def input_triggers_spinner(value):
@@ -218,13 +295,38 @@ def update_results(clicks, keyword, nr_videos, nr_users, graph_type, algorithm):
             logger.warning("User not authenticated")
 
         limit = int(nr_users)
-
-        # create crawler and network object
         file_name = create_file_name()
+
+        # plan the crawl and downscale the searches that need too much of the remaining quota
         try:
-            crawler = YoutubeAPI(file_name, NETWORKS_FOLDER, COMMENT_PAGES_LIMIT)
+            crawler = create_crawler(file_name)
         except errors.ConnectionFailure:
             return '', database_alert, ''
+        plan = crawler.plan_search(keyword, int(nr_videos))
+        max_quota = plan['remaining'] * SEARCH_QUOTA_SHARE
+        alerts = []
+        if plan['quota'] > max_quota:
+            fitted = downscale_search(lambda n: crawler.plan_search(keyword, n), int(nr_videos), max_quota)
+            if fitted == 0:
+                logger.warning("Search [" + keyword + "] refused, it needs " + str(plan['quota']) + " quota units")
+                return '', oversized_alert, ''
+            logger.info("Search [" + keyword + "] downscaled from " + str(nr_videos) + " to " + str(fitted) +
+                        " videos")
+            nr_videos = fitted
+            alerts.append(downscaled_alert(fitted))
+
+        if DISTRIBUTED_CRAWL:
+            # the crawl workers create the network, the dashboard shows it when it is finished
+            if not add_user_search(current_user.id, keyword, file_name, file_name, "Queued", nr_videos, limit,
+                                   algorithm, graph_type, engine):
+                return '', failure_alert, ''
+            if not enqueue_crawl_job(file_name, keyword, nr_videos, algorithm, current_user.id, current_user.email,
+                                     current_user.first):
+                update_search_status(current_user.id, file_name, "Failed", engine)
+                return '', database_alert, ''
+            return '', alerts + [queued_alert], ''
+
+        # create network object
         network = NetworkAnalysis(NETWORKS_FOLDER)
 
         if not add_user_search(current_user.id, keyword, file_name, file_name, "Retrieving Data", nr_videos, limit,
@@ -233,22 +335,18 @@ def update_results(clicks, keyword, nr_videos, nr_users, graph_type, algorithm):
                 return '', failure_alert, ''
 
         results = crawler.search(keyword, int(nr_videos))
-        crawler.process_search_results(results)
-
-        try:
-            network_data = results[0]['_id']
-            if not crawler.create_network(network_data):
-                logger.error("Cannot create network: " + file_name)
-        except TypeError:
+        if not results:
             return '', quota_exceeded_alert, ''
 
+        # create users network while the data is retrieved
+        network.set_files(file_name, file_name)
+        network.start_network()
+        for source, target, source_name, target_name in crawler.stream_network(results):
+            network.add_edge(source, target, source_name, target_name)
+
         if not update_search_status(current_user.id, file_name, "Processing Data", engine):
             return '', failure_alert, ''
 
-        # create users network
-        network.set_files(file_name, file_name)
-        network.create_network()
-
         if not network.compute_ranking(algorithm):
             delete_user_network(file_name, engine)
             return '', graph_alert(algorithm), ''
@@ -283,7 +381,7 @@ def update_results(clicks, keyword, nr_videos, nr_users, graph_type, algorithm):
                 create_data_table_network(values, columns)
             ],
             id='dash-container'
-        ), success_alert, ''
+        ), alerts + [success_alert], ''
     else:
         return '', '', ''
 
@@ -6,6 +6,17 @@ import dash_table
 
 STRING_LENGTH = 10
 COMMENT_PAGES_LIMIT = 5
+CRAWLER_CONCURRENCY = 8
+INCREMENTAL_COMMENTS = False
+INCLUDE_TEXT = True
+ADAPTIVE_COMMENT_PAGES = True
+CHANNEL_EXPANSION = 'uploads'      # 'playlists' crawls every playlist of a channel, 'uploads' only its uploads
+CHANNEL_VIDEOS_LIMIT = 50           # maximum number of uploads crawled for a channel
+REQUEST_BATCH_SIZE = 20            # first page requests sent in one http batch, 0 disables batching
+WRITE_BATCH_SIZE = 500             # database writes sent in one bulk write, 0 writes every document immediately
+SKIP_UNCHANGED_WRITES = True       # skip the writes of the documents whose content hash did not change
+SEARCH_QUOTA_SHARE = 0.25          # fraction of the remaining quota one search can spend, larger ones are downscaled
+DISTRIBUTED_CRAWL = False           # queue the searches for the crawl workers instead of crawling in the web process
 NR_VIDEOS_LIMIT = 50
 NETWORKS_FOLDER = ".networks/"
 